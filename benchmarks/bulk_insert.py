@@ -0,0 +1,106 @@
+"""
+Benchmark for the two Stats.bulk_insert ingestion modes.
+
+Runs upsert_unnest and upsert_copy on synthetic batches against a Postgres database
+that has db.sql loaded. Each run happens in a transaction that is rolled back, so
+every mode sees the same table contents.
+
+Usage: python -m benchmarks.bulk_insert [--dsn postgresql://...] [--sizes 1000 10000 100000]
+Without --dsn, config.db is used.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+import asyncpg
+
+from cogs.statistics import upsert_copy, upsert_unnest
+
+GUILD_ID = 1
+
+
+def make_batch(rows, seed=0):
+    """Unique-key rows split roughly 70/20/10 between messages, emojis and voice."""
+    rng = random.Random(seed)
+    today = date.today()
+    days = [today - timedelta(days=i) for i in range(30)]
+    messages = {}
+    while len(messages) < rows * 7 // 10:
+        key = (
+            GUILD_ID,
+            rng.randrange(50),
+            rng.randrange(rows),
+            rng.choice(("OL", "JP", "EN")),
+            rng.choice(days),
+        )
+        messages[key] = rng.randrange(1, 20)
+    emojis = {}
+    while len(emojis) < rows * 2 // 10:
+        key = (
+            GUILD_ID,
+            rng.randrange(rows),
+            f"emoji{rng.randrange(500)}",
+            rng.choice(days),
+        )
+        emojis[key] = rng.randrange(1, 5)
+    voices = {}
+    while len(voices) < rows - len(messages) - len(emojis):
+        key = (GUILD_ID, rng.randrange(rows * 10), rng.choice(days))
+        voices[key] = rng.randrange(1, 300)
+    return (
+        [(*key, n) for key, n in messages.items()],
+        [(g, u, e, d, n) for (g, u, e, d), n in emojis.items()],
+        [(*key, n) for key, n in voices.items()],
+    )
+
+
+async def time_upsert(conn, upsert, batch):
+    transaction = conn.transaction()
+    await transaction.start()
+    try:
+        start = time.perf_counter()
+        await upsert(conn, *batch)
+        return time.perf_counter() - start
+    finally:
+        await transaction.rollback()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dsn")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.dsn:
+        conn = await asyncpg.connect(args.dsn)
+    else:
+        import config
+
+        conn = await asyncpg.connect(**config.db)
+    await conn.execute(
+        "INSERT INTO guilds (guild_id) VALUES ($1) ON CONFLICT DO NOTHING", GUILD_ID
+    )
+
+    for size in args.sizes:
+        batch = make_batch(size)
+        print(f"{size} rows")
+        for name, upsert in (("unnest", upsert_unnest), ("copy", upsert_copy)):
+            await time_upsert(conn, upsert, batch)  # warm up
+            timings = [
+                await time_upsert(conn, upsert, batch) for _ in range(args.repeat)
+            ]
+            median = statistics.median(timings)
+            print(
+                f"{name:>8}: median {median * 1000:9.2f}ms "
+                f"min {min(timings) * 1000:9.2f}ms "
+                f"({size / median:,.0f} rows/s)"
+            )
+    await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
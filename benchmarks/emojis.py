@@ -0,0 +1,94 @@
+"""
+Benchmark for cogs.utils.parser.extract_unicode_emojis.
+
+Compares the current extractor against the original grapheme-by-grapheme lookup
+on a few message mixes, and checks that both return the same emoji lists.
+
+Usage: python -m benchmarks.emojis [--lines 5000] [--repeat 5]
+"""
+import argparse
+import random
+import timeit
+import warnings
+
+import emoji
+import regex
+
+from cogs.utils.parser import extract_unicode_emojis
+
+ASCII_WORDS = "the quick brown fox jumps over lazy dog lol ok :) <3 ^^ 100% #1".split()
+JP_WORDS = "こんにちは ありがとう 日本語 勉強 してます 難しい ですね ｶﾀｶﾅ ＊".split()
+EMOJIS = ["😂", "👍", "👍🏻", "❤️", "🇯🇵", "👨‍👩‍👧", "1️⃣", "©", "✨", "🙏🏽"]
+
+MIXES = {
+    # share of ascii-only lines, JP lines, and lines with emojis
+    "mostly ascii": (0.85, 0.1, 0.05),
+    "jp chat": (0.3, 0.6, 0.1),
+    "emoji heavy": (0.3, 0.2, 0.5),
+}
+
+
+def extract_unicode_emojis_reference(text):
+    """The original implementation, kept for comparison."""
+    emoji_list = []
+    data = regex.findall(r"\X", text)
+    for word in data:
+        if any(char in emoji.UNICODE_EMOJI_ENGLISH for char in word):
+            emoji_list.append(word)
+    return emoji_list
+
+
+def make_corpus(lines, mix, seed=0):
+    rng = random.Random(seed)
+    ascii_share, jp_share, _ = mix
+    corpus = []
+    for _ in range(lines):
+        roll = rng.random()
+        n = max(1, int(rng.paretovariate(1.2) * 4))
+        if roll < ascii_share:
+            words = [rng.choice(ASCII_WORDS) for _ in range(n)]
+        elif roll < ascii_share + jp_share:
+            words = [rng.choice(JP_WORDS + ASCII_WORDS) for _ in range(n)]
+        else:
+            words = [rng.choice(JP_WORDS + ASCII_WORDS + EMOJIS) for _ in range(n)]
+            words.append(rng.choice(EMOJIS))
+        corpus.append(" ".join(words)[:4000])
+    return corpus
+
+
+def run(func, corpus):
+    for text in corpus:
+        func(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    warnings.simplefilter("ignore", DeprecationWarning)
+
+    for mix_name, mix in MIXES.items():
+        corpus = make_corpus(args.lines, mix)
+        for text in corpus:
+            expected = extract_unicode_emojis_reference(text)
+            actual = extract_unicode_emojis(text)
+            assert actual == expected, (text, expected, actual)
+
+        timings = {}
+        for name, func in (
+            ("reference", extract_unicode_emojis_reference),
+            ("extract_unicode_emojis", extract_unicode_emojis),
+        ):
+            timings[name] = min(
+                timeit.repeat(lambda: run(func, corpus), number=1, repeat=args.repeat)
+            )
+        print(f"{mix_name} ({len(corpus)} messages, results identical)")
+        for name, best in timings.items():
+            print(f"{name:>24}: {best * 1e6 / len(corpus):8.2f} us/message")
+        speedup = timings["reference"] / timings["extract_unicode_emojis"]
+        print(f"{'speedup':>24}: {speedup:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Minimal stand-ins for the bot, asyncpg pool and discord messages, so cogs can be
+driven from benchmarks without connecting to Discord.
+"""
+import asyncio
+import tempfile
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+
+class FakeConnection:
+    """Accepts every query and waits `latency` seconds per round-trip."""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def _round_trip(self):
+        self.pool.round_trips += 1
+        if self.pool.latency:
+            await asyncio.sleep(self.pool.latency)
+
+    async def execute(self, query, *args):
+        await self._round_trip()
+
+    async def fetch(self, query, *args):
+        await self._round_trip()
+        return []
+
+    async def fetchval(self, query, *args):
+        await self._round_trip()
+        return None
+
+    async def copy_records_to_table(self, table, *, records, columns=None):
+        await self._round_trip()
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+
+class FakePool:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.round_trips = 0
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield FakeConnection(self)
+
+    async def execute(self, query, *args):
+        return await FakeConnection(self).execute(query, *args)
+
+    async def fetch(self, query, *args):
+        return await FakeConnection(self).fetch(query, *args)
+
+    async def fetchval(self, query, *args):
+        return await FakeConnection(self).fetchval(query, *args)
+
+
+def make_bot(pool, **config):
+    """A bot with just enough attributes for Stats.__init__."""
+    config.setdefault("stats_journal_dir", tempfile.mkdtemp(prefix="stats_journal"))
+    return SimpleNamespace(
+        settings={},
+        pool=pool,
+        read_pool=pool,
+        write_pool=pool,
+        config=SimpleNamespace(**config),
+        loop=asyncio.get_running_loop(),
+        guilds=[],
+        is_ready=lambda: False,
+        get_cog=lambda name: None,
+    )
+
+
+def make_message(content, *, guild_id, channel_id, user_id):
+    return SimpleNamespace(
+        content=content,
+        guild=SimpleNamespace(id=guild_id),
+        channel=SimpleNamespace(id=channel_id),
+        author=SimpleNamespace(id=user_id, bot=False),
+        created_at=datetime.now(timezone.utc),
+    )
@@ -0,0 +1,238 @@
+"""
+Load test for the Stats ingest pipeline against Postgres.
+
+Sends fake messages at a fixed rate through the same steps as Cirilla.on_message:
+LanguagePool.parse, then Stats.on_safe_message. batch_update then flushes the
+buffered rows with bulk_insert into a scratch copy of db.sql. At the end the
+remaining rows are flushed, and the message counts in Postgres are checked
+against what was sent.
+
+Reports throughput, per-stage latency percentiles, flush sizes and peak RSS.
+With --save, the results are appended to a JSON lines file under the current
+commit. Earlier runs in that file with the same parameters are printed next to
+them for comparison.
+
+Usage: python -m benchmarks.ingest_load [--dsn postgresql://...] [--rate 2000]
+    [--seconds 30] [--guilds 3] [--channels 50] [--users 5000] [--mix 0.3 0.5 0.2]
+    [--parse-mode thread] [--ingest-mode unnest] [--save results.jsonl]
+Without --dsn, config.db is used.
+"""
+import argparse
+import asyncio
+import random
+import resource
+import time
+
+from cogs.statistics import Stats
+from cogs.utils.db_pool import create_pool
+from cogs.utils.language_pool import LanguagePool
+from cogs.utils.metrics import LatencyTracker
+from cogs.utils.queries import registry
+
+from .fakes import make_bot, make_message
+from .parse_language import EN_WORDS, JP_WORDS, OL_WORDS
+from .results import current_commit, previous_runs, save
+from .schema import connect_args, scratch_schema
+
+SCHEMA = "stats_ingest_load"
+# Share of messages long enough to be offloaded by the language pool
+LONG_SHARE = 0.01
+
+
+class MeasuredStats(Stats):
+    """Stats that records the size and duration of every flush."""
+
+    def __init__(self, bot):
+        super().__init__(bot)
+        self.flush_rows = []
+        self.flush_latency = LatencyTracker()
+
+    async def bulk_insert(self, messages, emojis, voices):
+        start = time.perf_counter()
+        await super().bulk_insert(messages, emojis, voices)
+        self.flush_latency.add(time.perf_counter() - start)
+        self.flush_rows.append(len(messages) + len(emojis) + len(voices))
+
+
+def make_messages(args, count, seed=0):
+    rng = random.Random(seed)
+    languages = rng.choices((JP_WORDS, EN_WORDS, OL_WORDS), weights=args.mix, k=count)
+    messages = []
+    for words in languages:
+        length = 300 if rng.random() < LONG_SHARE else rng.randrange(1, 15)
+        messages.append(
+            make_message(
+                " ".join(rng.choices(words, k=length)),
+                guild_id=rng.randrange(1, args.guilds + 1),
+                channel_id=rng.randrange(args.channels),
+                user_id=rng.randrange(args.users),
+            )
+        )
+    return messages
+
+
+async def drive(stats, language_pool, messages, rate):
+    """Dispatch `messages` as tasks at `rate` per second, like discord.py does."""
+    loop = asyncio.get_running_loop()
+    listener = LatencyTracker(size=len(messages))
+    end_to_end = LatencyTracker(size=len(messages))
+
+    async def on_message(message, dispatched):
+        lang, escaped, emojis = await language_pool.parse(message)
+        start = time.perf_counter()
+        await stats.on_safe_message(message, lang=lang, escaped=escaped, emojis=emojis)
+        listener.add(time.perf_counter() - start)
+        end_to_end.add(loop.time() - dispatched)
+
+    tasks = []
+    start = loop.time()
+    sent = 0
+    while sent < len(messages):
+        due = min(len(messages), int((loop.time() - start) * rate) + 1)
+        now = loop.time()
+        for message in messages[sent:due]:
+            tasks.append(asyncio.create_task(on_message(message, now)))
+        sent = due
+        await asyncio.sleep(0.001)
+    await asyncio.gather(*tasks)
+    return listener, end_to_end, loop.time() - start
+
+
+def compare(path, result):
+    """Print earlier runs from `path` with the same parameters as `result`."""
+    runs = previous_runs(path, result["params"])
+    if not runs:
+        return
+    print(f"\nRuns with the same parameters in {path}:")
+    print(
+        f"{'commit':>14} {'sent/s':>9} {'stored/s':>9} {'listener p99':>13} {'flush p99':>10}"
+    )
+    for run in runs:
+        print(
+            f"{run['commit']:>14} {run['sent_per_s']:>9,.0f} {run['stored_per_s']:>9,.0f} "
+            f"{run['listener_p99_ms']:>11.3f}ms {run['flush_p99_ms']:>8.1f}ms"
+        )
+
+
+async def run(args, schema_args):
+    pool = await create_pool(
+        **schema_args,
+        name="bench",
+        min_size=2,
+        max_size=2,
+        statement_cache_size=256,
+        setup=registry.setup,
+    )
+    bot = make_bot(
+        pool,
+        stats_flush_interval=args.flush_interval,
+        stats_ingest_mode=args.ingest_mode,
+    )
+    language_pool = LanguagePool(mode=args.parse_mode, workers=args.workers)
+    stats = MeasuredStats(bot)
+    stats.clear_old_records.cancel()
+
+    messages = make_messages(args, int(args.rate * args.seconds))
+    print(f"Sending {len(messages)} messages at {args.rate}/s")
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    listener, end_to_end, elapsed = await drive(
+        stats, language_pool, messages, args.rate
+    )
+    # Let a flush in progress finish, then flush what's still buffered
+    stats.batch_update.stop()
+    while stats.batch_update.is_running():
+        await asyncio.sleep(0.01)
+    await stats.flush()
+    stored_elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    languages = {
+        r["lang"]: r["count"]
+        for r in await pool.fetch(
+            "SELECT lang, SUM(message_count) AS count FROM messages GROUP BY lang"
+        )
+    }
+    stored = sum(languages.values())
+    pool_summary = pool.summary()
+    language_pool.shutdown()
+    await pool.close()
+
+    sizes = stats.flush_rows
+    result = {
+        "commit": current_commit(),
+        "params": {
+            key: getattr(args, key)
+            for key in (
+                "rate",
+                "seconds",
+                "guilds",
+                "channels",
+                "users",
+                "mix",
+                "parse_mode",
+                "ingest_mode",
+                "flush_interval",
+            )
+        },
+        "sent_per_s": len(messages) / elapsed,
+        "stored_per_s": stored / stored_elapsed,
+        "listener_p99_ms": listener.percentile(99) * 1000,
+        "flush_p99_ms": stats.flush_latency.percentile(99) * 1000,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    print(
+        f"sent {len(messages)} in {elapsed:.1f}s ({result['sent_per_s']:,.0f}/s), "
+        f"stored {stored} by {stored_elapsed:.1f}s ({result['stored_per_s']:,.0f}/s), "
+        f"cpu {cpu:.1f}s"
+    )
+    if stored != len(messages):
+        print(f"MISMATCH: {len(messages) - stored} messages missing from Postgres")
+    print(language_pool.summary())
+    print(f"on_safe_message: {listener.summary()}")
+    print(f"dispatch to counted: {end_to_end.summary()}")
+    print(f"bulk_insert: {stats.flush_latency.summary()}")
+    if sizes:
+        print(
+            f"flush sizes: {len(sizes)} flushes, avg {sum(sizes) / len(sizes):,.0f} "
+            f"max {max(sizes):,} rows"
+        )
+    print(f"stored by language: {languages}")
+    print(pool_summary)
+    print(f"peak RSS: {result['peak_rss_mb']:.0f}MB")
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dsn")
+    parser.add_argument("--rate", type=int, default=2000, help="messages per second")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--guilds", type=int, default=3)
+    parser.add_argument("--channels", type=int, default=50, help="per guild")
+    parser.add_argument("--users", type=int, default=5000, help="per guild")
+    parser.add_argument(
+        "--mix",
+        type=float,
+        nargs=3,
+        default=[0.3, 0.5, 0.2],
+        metavar=("JP", "EN", "OL"),
+        help="language weights of the generated messages",
+    )
+    parser.add_argument("--parse-mode", default="thread")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--ingest-mode", default="unnest")
+    parser.add_argument("--flush-interval", type=float, default=5.0)
+    parser.add_argument("--save", help="JSON lines file to append the results to")
+    args = parser.parse_args()
+
+    guild_ids = range(1, args.guilds + 1)
+    async with scratch_schema(connect_args(args.dsn), SCHEMA, guild_ids) as schema_args:
+        result = await run(args, schema_args)
+    if args.save:
+        compare(args.save, result)
+        save(args.save, result)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+"""
+Benchmark for the Stats.on_safe_message hot path.
+
+Dispatches messages at a fixed rate as separate tasks (like discord.py does) while
+another task periodically holds _batch_lock, the way a slow flush or
+clear_old_records does. Compares the current lock-free listener against one that
+takes _batch_lock for every message, as the listeners used to.
+
+Usage: python -m benchmarks.on_safe_message [--messages 20000] [--rate 5000]
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from cogs.statistics import Stats
+from cogs.utils.metrics import LatencyTracker
+
+from .fakes import FakePool, make_bot, make_message
+
+
+class LockedStats(Stats):
+    async def on_safe_message(self, m, **kwargs):
+        async with self._batch_lock:
+            await Stats.on_safe_message(self, m, **kwargs)
+
+
+async def hold_lock(stats, hold, every):
+    while True:
+        await asyncio.sleep(every)
+        async with stats._batch_lock:
+            await asyncio.sleep(hold)
+
+
+async def drive(stats, messages, rate):
+    loop = asyncio.get_running_loop()
+    latency = LatencyTracker(size=len(messages))
+
+    async def handle(message, dispatched):
+        await stats.on_safe_message(message, lang="EN", emojis=[])
+        latency.add(loop.time() - dispatched)
+
+    tasks = []
+    start = loop.time()
+    sent = 0
+    while sent < len(messages):
+        due = min(len(messages), int((loop.time() - start) * rate) + 1)
+        now = loop.time()
+        for message in messages[sent:due]:
+            tasks.append(asyncio.create_task(handle(message, now)))
+        sent = due
+        await asyncio.sleep(0.001)
+    await asyncio.gather(*tasks)
+    return latency, loop.time() - start
+
+
+async def run(cls, args):
+    bot = make_bot(FakePool())
+    stats = cls(bot)
+    rng = random.Random(0)
+    messages = [
+        make_message(
+            "hello there",
+            guild_id=1,
+            channel_id=rng.randrange(20),
+            user_id=rng.randrange(2000),
+        )
+        for _ in range(args.messages)
+    ]
+    holder = asyncio.create_task(
+        hold_lock(stats, args.hold_ms / 1000, args.every_ms / 1000)
+    )
+    cpu_start = time.process_time()
+    latency, elapsed = await drive(stats, messages, args.rate)
+    cpu = time.process_time() - cpu_start
+    holder.cancel()
+    stats.batch_update.cancel()
+    stats.clear_old_records.cancel()
+    print(f"{cls.__name__} ({len(messages) / elapsed:,.0f} messages/s, cpu {cpu:.2f}s)")
+    print(f"    dispatch to done: {latency.summary()}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--rate", type=int, default=5000, help="messages per second")
+    parser.add_argument("--hold-ms", type=float, default=50.0)
+    parser.add_argument("--every-ms", type=float, default=500.0)
+    args = parser.parse_args()
+    for cls in (LockedStats, Stats):
+        await run(cls, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,128 @@
+"""
+Micro-benchmark for cogs.utils.parser.parse_language.
+
+Compares the translate-based classifier against the old per-character regex loop
+on a corpus of mixed JP/EN chat lines, and checks that both agree on every line.
+
+Usage: python -m benchmarks.parse_language [--lines 5000] [--repeat 5]
+"""
+import argparse
+import random
+import re
+import timeit
+import warnings
+from types import SimpleNamespace
+
+from cogs.utils.parser import (
+    REGEX_DISCORD_OBJ,
+    REGEX_ENG,
+    REGEX_JPN,
+    REGEX_URL,
+    JP_RATIO,
+    parse_language,
+)
+from .emojis import extract_unicode_emojis_reference
+
+EN_WORDS = (
+    "the quick brown fox jumps over lazy dog what why how is this lol ok yeah".split()
+)
+JP_WORDS = "こんにちは ありがとう 日本語 勉強 してます 難しい ですね 漢字 カタカナ ｶﾀｶﾅ そうだね".split()
+OL_WORDS = "¯\\_(ツ)_/¯ ^^ :) 123 ?! ... ñandú привет 안녕 ＊ *".split()
+EXTRAS = [
+    "<@123456789012345678>",
+    "<#123456789012345678>",
+    "<:pepe:123456789012345678>",
+    "https://www.example.com/some/path?q=1",
+    "😂",
+    "👍🏻",
+    "🇯🇵",
+    "wwww",
+    "ｗｗｗ",
+    "Ｆｕｌｌｗｉｄｔｈ",
+]
+
+
+def parse_language_reference(message):
+    """The original per-character implementation, kept for comparison."""
+    jp_count = en_count = ol_count = 0
+    escaped = False
+    content = REGEX_DISCORD_OBJ.sub("", message.content)
+    content = REGEX_URL.sub("", content)
+    emojis = extract_unicode_emojis_reference(content)
+    for emoji in emojis:
+        content = content.replace(emoji, "")
+    for c in content:
+        if c == "*" or c == "＊":
+            escaped = True
+        elif REGEX_ENG.match(c):
+            en_count += 1
+        elif REGEX_JPN.match(c):
+            jp_count += 1
+        elif not re.match(r"[\swWｗＷ]", c):
+            ol_count += 1
+    if jp_count == 0 and en_count == 0:
+        lang = "OL"
+    elif jp_count < 3 and en_count < 3 and ol_count > 0:
+        lang = "OL"
+    elif jp_count * JP_RATIO > en_count:
+        lang = "JP"
+    else:
+        lang = "EN"
+    return (lang, escaped, emojis)
+
+
+def make_corpus(lines, seed=0):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(lines):
+        jp_weight = rng.random()
+        words = []
+        for _ in range(int(rng.paretovariate(1.2) * 4)):
+            roll = rng.random()
+            if roll < 0.05:
+                words.append(rng.choice(EXTRAS))
+            elif roll < 0.1:
+                words.append(rng.choice(OL_WORDS))
+            elif roll < 0.1 + jp_weight * 0.9:
+                words.append(rng.choice(JP_WORDS))
+            else:
+                words.append(rng.choice(EN_WORDS))
+        corpus.append(SimpleNamespace(content=" ".join(words)[:4000]))
+    return corpus
+
+
+def run(func, corpus):
+    for message in corpus:
+        func(message)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    warnings.simplefilter("ignore", DeprecationWarning)
+
+    corpus = make_corpus(args.lines)
+    for message in corpus:
+        expected = parse_language_reference(message)
+        actual = parse_language(message)
+        assert actual == expected, (message.content, expected, actual)
+
+    chars = sum(len(m.content) for m in corpus)
+    print(f"{len(corpus)} messages, {chars} characters, results identical")
+    results = {}
+    for name, func in (
+        ("reference", parse_language_reference),
+        ("parse_language", parse_language),
+    ):
+        best = min(
+            timeit.repeat(lambda: run(func, corpus), number=1, repeat=args.repeat)
+        )
+        results[name] = best
+        print(f"{name:>16}: {best * 1e6 / len(corpus):8.2f} us/message")
+    print(f"{'speedup':>16}: {results['reference'] / results['parse_language']:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
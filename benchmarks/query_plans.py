@@ -0,0 +1,206 @@
+"""
+Plan and runtime regression check for the Stats command statements.
+
+Loads db.sql into a scratch schema, fills it with a synthetic 30-day dataset
+through the real ingest path, then runs EXPLAIN ANALYZE on every statement in
+cogs.utils.queries.registry. Every statement has to be prepared on a pool connection
+after one acquire. A statement fails the check when its plan sequentially
+scans one of the raw tables (messages / emojis / voice) or when it runs longer than
+its budget, or when it errors. The schema is dropped afterwards. Exits with status 1
+when any check fails, so it can gate a merge.
+
+Usage: python -m benchmarks.query_plans [--dsn postgresql://...] [--users 5000]
+Without --dsn, config.db is used.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+from datetime import date, timedelta
+
+import asyncpg
+
+from cogs.statistics import upsert_copy
+from cogs.utils.db_pool import create_pool
+from cogs.utils.queries import registry
+
+from .schema import connect_args, scratch_schema
+
+SCHEMA = "stats_query_plans"
+GUILDS = [1, 2, 3, 4, 5, 6, 7, 8]
+GUILD_ID = GUILDS[0]
+CHANNELS = 40
+EMOJIS = 300
+DAYS = 30
+# Scans of these tables' non-empty partitions have to go through an index
+RAW_TABLES = ("messages", "emojis", "voice")
+DEFAULT_BUDGET_MS = 50.0
+# Statements that read a whole guild, or everything, get more room
+BUDGETS_MS = {
+    "emoji_users_leaderboard": 250.0,
+    "emoji_percentile_leaderboard": 250.0,
+    "emoji_leaderboard": 150.0,
+    "leaderboard_index": 250.0,
+}
+# Ingest statements only run in bulk_insert
+SKIPPED_PREFIXES = ("upsert_", "merge_", "message_totals_", "voice_totals_")
+
+
+def make_dataset(users, seed=0):
+    """Message, emoji and voice rows for DAYS days over GUILDS."""
+    rng = random.Random(seed)
+    today = date.today()
+    days = [today - timedelta(days=i) for i in range(DAYS)]
+    messages, emojis, voices = {}, {}, {}
+    for guild_id in GUILDS:
+        for user_id in range(users):
+            active_days = rng.sample(days, rng.randrange(1, DAYS))
+            channels = rng.sample(range(CHANNELS), rng.randrange(1, 5))
+            for day in active_days:
+                for channel_id in channels:
+                    lang = rng.choice(("OL", "JP", "EN"))
+                    messages[
+                        (guild_id, channel_id, user_id, lang, day)
+                    ] = rng.randrange(1, 50)
+                if rng.random() < 0.3:
+                    emoji = f"emoji{rng.randrange(EMOJIS)}"
+                    emojis[(guild_id, user_id, emoji, day)] = rng.randrange(1, 5)
+                if rng.random() < 0.1:
+                    voices[(guild_id, user_id, day)] = rng.randrange(1, 300)
+    return (
+        [(*key, n) for key, n in messages.items()],
+        [(*key, n) for key, n in emojis.items()],
+        [(*key, n) for key, n in voices.items()],
+    )
+
+
+def statement_args(users):
+    """Arguments of every checked statement, by name."""
+    user_id = users // 2
+    members = list(range(0, users, 10))
+    channels = [0, 1, 2]
+    args = {
+        "messages_for_users": (GUILD_ID, members[:25]),
+        "user_top_emojis": (GUILD_ID, user_id),
+        "user_voice_minutes": (GUILD_ID, user_id),
+        "user_messages": (GUILD_ID, user_id, []),
+        "japanese_leaderboard": (GUILD_ID, 100),
+        "english_leaderboard": (GUILD_ID, 100),
+        "emoji_users_leaderboard": (GUILD_ID,),
+        "emoji_leaderboard": (GUILD_ID,),
+        "emoji_usage_leaderboard": (GUILD_ID, "emoji1", user_id),
+        "emoji_percentile_leaderboard": (GUILD_ID, 0.5),
+        "user_activity": (GUILD_ID, user_id),
+        "channel_activity": (GUILD_ID, channels),
+        "server_activity": (GUILD_ID,),
+        "leaderboard_index": (),
+    }
+    rankings = {
+        "leaderboard": (GUILD_ID,),
+        "leaderboard_role": (GUILD_ID, members),
+        "channel_leaderboard": (GUILD_ID, channels),
+        "channel_leaderboard_role": (GUILD_ID, channels, members),
+        "voice_leaderboard": (GUILD_ID,),
+        "voice_leaderboard_role": (GUILD_ID, members),
+    }
+    for name, base in rankings.items():
+        args[f"{name}_count"] = base
+        args[f"{name}_page"] = (*base, 20, 100)
+        args[f"{name}_find"] = (*base, user_id)
+    return args
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from plan_nodes(child)
+
+
+def raw_table(relation):
+    for table in RAW_TABLES:
+        if relation == table or relation.startswith(f"{table}_"):
+            return table
+    return None
+
+
+async def check(conn, statement, args):
+    """Returns (milliseconds, [problems]) for one statement."""
+    rows = await conn.fetchval(f"EXPLAIN (ANALYZE, FORMAT JSON) {statement.sql}", *args)
+    result = json.loads(rows)[0]
+    problems = []
+    for node in plan_nodes(result["Plan"]):
+        relation = node.get("Relation Name", "")
+        if node["Node Type"] != "Seq Scan" or not raw_table(relation):
+            continue
+        # The planner seq scans empty partitions (future days, default), that's fine
+        read = node["Actual Rows"] + node.get("Rows Removed by Filter", 0)
+        if read:
+            problems.append(f"sequential scan on {relation} reading {read} rows")
+    ms = result["Execution Time"]
+    budget = BUDGETS_MS.get(statement.name, DEFAULT_BUDGET_MS)
+    if ms > budget:
+        problems.append(f"{ms:.1f}ms over the {budget:.0f}ms budget")
+    return ms, problems
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dsn")
+    parser.add_argument("--users", type=int, default=5000)
+    args = parser.parse_args()
+
+    failed = 0
+    async with scratch_schema(connect_args(args.dsn), SCHEMA, GUILDS) as schema_args:
+        pool = await create_pool(
+            **schema_args,
+            name="plans",
+            min_size=1,
+            max_size=1,
+            statement_cache_size=256,
+            setup=registry.setup,
+        )
+        async with pool.acquire() as conn:
+            unprepared = registry.statements.keys() - conn.statements.keys()
+        await pool.close()
+        print(
+            f"{len(registry.statements) - len(unprepared)} statements prepared on acquire"
+        )
+        if unprepared:
+            print(f"Not prepared: {', '.join(sorted(unprepared))}")
+            failed += len(unprepared)
+
+        conn = await asyncpg.connect(**schema_args)
+        try:
+            messages, emojis, voices = make_dataset(args.users)
+            print(
+                f"Loading {len(messages)} message, {len(emojis)} emoji "
+                f"and {len(voices)} voice rows"
+            )
+            async with conn.transaction():
+                await upsert_copy(conn, messages, emojis, voices)
+            await conn.execute("VACUUM ANALYZE")
+
+            all_args = statement_args(args.users)
+            for name, statement in sorted(registry.statements.items()):
+                if name.startswith(SKIPPED_PREFIXES):
+                    continue
+                if name not in all_args:
+                    print(f"{name:>34}: no arguments defined, add it to statement_args")
+                    failed += 1
+                    continue
+                try:
+                    ms, problems = await check(conn, statement, all_args[name])
+                except asyncpg.PostgresError as e:
+                    ms, problems = 0.0, [f"{e.__class__.__name__}: {e}"]
+                failed += bool(problems)
+                status = "FAIL " + "; ".join(problems) if problems else "ok"
+                print(f"{name:>34}: {ms:8.2f}ms {status}")
+        finally:
+            await conn.close()
+    print(f"{failed} statements failed" if failed else "All statements passed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,39 @@
+"""
+Benchmark results kept in JSON lines files, one run per line tagged with the
+commit it ran on, so runs can be compared across commits.
+"""
+import json
+import subprocess
+
+
+def current_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}+dirty" if dirty else commit
+
+
+def previous_runs(path, params):
+    """Runs saved in `path` with the same `params`, oldest first."""
+    try:
+        with open(path) as f:
+            runs = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+    return [run for run in runs if run["params"] == params]
+
+
+def save(path, result):
+    with open(path, "a") as f:
+        f.write(json.dumps(result) + "\n")
@@ -0,0 +1,51 @@
+"""
+Scratch copies of the db.sql schema, for benchmarks that run against Postgres.
+"""
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import asyncpg
+
+DB_SQL = Path(__file__).parent.parent / "db.sql"
+
+
+def connect_args(dsn=None):
+    """asyncpg.connect() arguments for `dsn`, or config.db without one."""
+    if dsn:
+        return {"dsn": dsn}
+    import config
+
+    return dict(config.db)
+
+
+@asynccontextmanager
+async def scratch_schema(connect_args, name, guild_ids):
+    """
+    Load db.sql into a fresh schema `name` with `guild_ids` in guilds, and yield
+    connect arguments whose search_path points at it. The schema is dropped on exit.
+    """
+    conn = await asyncpg.connect(**connect_args)
+    try:
+        await conn.execute(
+            f"DROP SCHEMA IF EXISTS {name} CASCADE; CREATE SCHEMA {name}"
+        )
+    finally:
+        await conn.close()
+    # Everything, db.sql included, resolves to the scratch schema
+    schema_args = {**connect_args, "server_settings": {"search_path": name}}
+    try:
+        conn = await asyncpg.connect(**schema_args)
+        try:
+            await conn.execute(DB_SQL.read_text())
+            await conn.executemany(
+                "INSERT INTO guilds (guild_id) VALUES ($1)", [(g,) for g in guild_ids]
+            )
+        finally:
+            await conn.close()
+        yield schema_args
+    finally:
+        conn = await asyncpg.connect(**connect_args)
+        try:
+            await conn.execute(f"DROP SCHEMA {name} CASCADE")
+        finally:
+            await conn.close()
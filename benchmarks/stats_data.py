@@ -0,0 +1,113 @@
+"""
+Synthetic Stats data with Zipfian activity, for the db.sql schema.
+
+A few users write most of the messages in a few channels, like on a real server:
+users, channels and emojis are drawn from Zipf distributions. Rows go through
+upsert_copy, so the rolling totals and daily series are filled in too.
+
+Usage: python -m benchmarks.stats_data --rows 100000 [--guild 1] [--dsn postgresql://...]
+loads one guild's 30 days into an existing database. Without --dsn, config.db is used.
+"""
+import argparse
+import asyncio
+import random
+from bisect import bisect_left
+from datetime import date, timedelta
+from itertools import accumulate
+
+import asyncpg
+
+from cogs.statistics import upsert_copy
+
+from .schema import connect_args
+
+DAYS = 30
+ZIPF_EXPONENT = 1.1
+LANGS = ("JP", "EN", "OL")
+
+
+class Zipf:
+    """Samples 0..n-1, where k is drawn with weight 1 / (k + 1) ** exponent."""
+
+    def __init__(self, n, exponent=ZIPF_EXPONENT, *, rng):
+        self.rng = rng
+        self.cumulative = list(accumulate(1 / (k + 1) ** exponent for k in range(n)))
+        self.total = self.cumulative[-1]
+
+    def sample(self):
+        return bisect_left(self.cumulative, self.rng.random() * self.total)
+
+
+def generate(rows, guild_id, seed=0):
+    """
+    About `rows` message rows for `guild_id` over the past DAYS days, with emoji
+    and voice rows in proportion. Returns (messages, emojis, voices) row lists in
+    table column order, and the number of users.
+    """
+    rng = random.Random(seed)
+    today = date.today()
+    days = [today - timedelta(days=i) for i in range(DAYS)]
+    users = max(50, rows // 20)
+    channels = max(5, min(200, rows // 2000))
+    user_zipf = Zipf(users, rng=rng)
+    channel_zipf = Zipf(channels, rng=rng)
+    emoji_zipf = Zipf(500, rng=rng)
+    # Each user mostly writes in one language
+    user_langs = [rng.choices(LANGS, weights=(0.3, 0.5, 0.2))[0] for _ in range(users)]
+
+    messages = {}
+    while len(messages) < rows:
+        user_id = user_zipf.sample()
+        lang = user_langs[user_id] if rng.random() < 0.8 else rng.choice(LANGS)
+        key = (guild_id, channel_zipf.sample(), user_id, lang, rng.choice(days))
+        messages[key] = messages.get(key, 0) + rng.randrange(1, 10)
+    emojis = {}
+    while len(emojis) < rows // 5:
+        key = (
+            guild_id,
+            user_zipf.sample(),
+            f"emoji{emoji_zipf.sample()}",
+            rng.choice(days),
+        )
+        emojis[key] = emojis.get(key, 0) + 1
+    voices = {}
+    while len(voices) < min(rows // 20, users * DAYS // 2):
+        key = (guild_id, user_zipf.sample(), rng.choice(days))
+        voices[key] = voices.get(key, 0) + rng.randrange(1, 60)
+    return (
+        [(*key, n) for key, n in messages.items()],
+        [(*key, n) for key, n in emojis.items()],
+        [(*key, n) for key, n in voices.items()],
+        users,
+    )
+
+
+async def load(conn, rows, guild_id, seed=0):
+    """Generate and insert one guild's data, returns the number of users."""
+    messages, emojis, voices, users = generate(rows, guild_id, seed)
+    await conn.execute(
+        "INSERT INTO guilds (guild_id) VALUES ($1) ON CONFLICT DO NOTHING", guild_id
+    )
+    async with conn.transaction():
+        await upsert_copy(conn, messages, emojis, voices)
+    return users
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dsn")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--guild", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(**connect_args(args.dsn))
+    try:
+        users = await load(conn, args.rows, args.guild, args.seed)
+    finally:
+        await conn.close()
+    print(f"Loaded about {args.rows} message rows from {users} users")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
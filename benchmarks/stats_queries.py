@@ -0,0 +1,220 @@
+"""
+Latency of the Stats command queries at different server sizes.
+
+Loads one guild per size (message rows per month, Zipfian, see stats_data) into a
+scratch copy of db.sql, then runs the queries behind ,u ,lb ,chlb ,jplb ,emlb -p
+,vclb ,ac ,cac and ,sac through Stats itself, the way the commands do, without
+Discord. Users are picked with the same Zipf distribution, so active users
+are looked up more often. The query cache is bypassed unless --cached is given.
+
+With --save, the results are appended to a JSON lines file under the current
+commit, and earlier runs with the same parameters are printed next to them.
+
+Usage: python -m benchmarks.stats_queries [--dsn postgresql://...]
+    [--sizes 10000 100000 1000000] [--repeat 200] [--cached] [--save results.jsonl]
+Without --dsn, config.db is used.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from cogs.statistics import (
+    CHANNEL_ACTIVITY,
+    CHANNEL_LEADERBOARD,
+    EMOJI_PERCENTILE_LEADERBOARD,
+    JAPANESE_LEADERBOARD,
+    LEADERBOARD,
+    SERVER_ACTIVITY,
+    USER_ACTIVITY,
+    USER_MESSAGES,
+    USER_TOP_EMOJIS,
+    USER_VOICE_MINUTES,
+    VOICE_LEADERBOARD,
+    Stats,
+    format_activity,
+)
+from cogs.utils.db_pool import create_pool
+from cogs.utils.leaderboard import QueryPageSource, RankingPageSource
+from cogs.utils.metrics import LatencyTracker
+from cogs.utils.queries import registry
+from cogs.utils.query_cache import QueryCache
+from cogs.utils.rank_index import GuildRanking
+
+from .fakes import make_bot
+from .results import current_commit, previous_runs, save
+from .schema import connect_args, scratch_schema
+from .stats_data import Zipf, load
+
+SCHEMA = "stats_query_bench"
+PER_PAGE = 20
+
+
+async def first_page(source, user_id):
+    """What a paginated leaderboard fetches before it is first shown."""
+    count, record = await asyncio.gather(source.count(), source.find(user_id))
+    await source.fetch(0, PER_PAGE)
+    return count, record
+
+
+async def user(stats, guild_id, user_id, channels):
+    await asyncio.gather(
+        stats.fetch(USER_TOP_EMOJIS, guild_id, user_id),
+        stats.fetchval(USER_VOICE_MINUTES, guild_id, user_id),
+        stats.fetch(USER_MESSAGES, guild_id, user_id, []),
+    )
+
+
+async def staff_ping(stats, guild_id, user_id, channels):
+    # EJLX.staff_ping passes the keys of a dict of users. Two pings at once should
+    # share one query through Stats.in_flight
+    users = {user_id + i: None for i in range(5)}
+    await asyncio.gather(
+        stats.get_messages_for_users(guild_id, users.keys()),
+        stats.get_messages_for_users(guild_id, users.keys()),
+    )
+
+
+async def leaderboard(stats, guild_id, user_id, channels):
+    ranking = stats.leaderboard_index.get(guild_id) or GuildRanking()
+    source = RankingPageSource(ranking)
+    ranking.record(user_id)
+    await source.count()
+    await source.fetch(0, PER_PAGE)
+
+
+async def leaderboard_sql(stats, guild_id, user_id, channels):
+    await first_page(QueryPageSource(stats, LEADERBOARD, guild_id), user_id)
+
+
+async def channel_leaderboard(stats, guild_id, user_id, channels):
+    await first_page(
+        QueryPageSource(stats, CHANNEL_LEADERBOARD, guild_id, channels), user_id
+    )
+
+
+async def japanese_leaderboard(stats, guild_id, user_id, channels):
+    await stats.fetch(JAPANESE_LEADERBOARD, guild_id, 500)
+
+
+async def emoji_percentile_leaderboard(stats, guild_id, user_id, channels):
+    await stats.fetch(EMOJI_PERCENTILE_LEADERBOARD, guild_id, 0.5)
+
+
+async def voice_leaderboard(stats, guild_id, user_id, channels):
+    await first_page(QueryPageSource(stats, VOICE_LEADERBOARD, guild_id), user_id)
+
+
+async def user_activity(stats, guild_id, user_id, channels):
+    format_activity("", await stats.fetch(USER_ACTIVITY, guild_id, user_id), False)
+
+
+async def channel_activity(stats, guild_id, user_id, channels):
+    format_activity("", await stats.fetch(CHANNEL_ACTIVITY, guild_id, channels), False)
+
+
+async def server_activity(stats, guild_id, user_id, channels):
+    format_activity("", await stats.fetch(SERVER_ACTIVITY, guild_id), False)
+
+
+COMMANDS = {
+    "u": user,
+    "staff ping": staff_ping,
+    "lb": leaderboard,
+    "lb (sql)": leaderboard_sql,
+    "chlb": channel_leaderboard,
+    "jplb": japanese_leaderboard,
+    "emlb -p": emoji_percentile_leaderboard,
+    "vclb": voice_leaderboard,
+    "ac": user_activity,
+    "cac": channel_activity,
+    "sac": server_activity,
+}
+
+
+async def run(stats, guild_id, users, repeat, seed=0):
+    rng = random.Random(seed)
+    user_zipf = Zipf(users, rng=rng)
+    latencies = {}
+    for name, command in COMMANDS.items():
+        latency = latencies[name] = LatencyTracker(size=repeat)
+        for _ in range(repeat):
+            user_id = user_zipf.sample()
+            # The busiest channel, sometimes with a couple of others
+            channels = [0] if rng.random() < 0.7 else [0, 1, 2]
+            start = time.perf_counter()
+            await command(stats, guild_id, user_id, channels)
+            latency.add(time.perf_counter() - start)
+    return latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dsn")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--cached", action="store_true", help="use the query cache")
+    parser.add_argument("--save", help="JSON lines file to append the results to")
+    args = parser.parse_args()
+
+    guild_ids = range(1, len(args.sizes) + 1)
+    results = {}
+    async with scratch_schema(connect_args(args.dsn), SCHEMA, guild_ids) as schema_args:
+        pool = await create_pool(
+            **schema_args,
+            name="bench",
+            min_size=5,
+            max_size=5,
+            statement_cache_size=256,
+            setup=registry.setup,
+        )
+        try:
+            users = {}
+            async with pool.acquire() as conn:
+                for guild_id, size in zip(guild_ids, args.sizes):
+                    print(f"Loading {size} rows into guild {guild_id}")
+                    users[guild_id] = await load(conn, size, guild_id)
+                await conn.execute("VACUUM ANALYZE")
+
+            stats = Stats(make_bot(pool))
+            stats.batch_update.cancel()
+            stats.clear_old_records.cancel()
+            if not args.cached:
+                stats.query_cache = QueryCache(ttl=0.0)
+            await stats.reload_leaderboard_index()
+
+            for guild_id, size in zip(guild_ids, args.sizes):
+                print(f"\n{size} rows/month, {users[guild_id]} users")
+                latencies = await run(stats, guild_id, users[guild_id], args.repeat)
+                for name, latency in latencies.items():
+                    print(f"{name:>10}: {latency.summary()}")
+                print(stats.in_flight.summary())
+                results[str(size)] = {
+                    name: {
+                        "p50_ms": latency.percentile(50) * 1000,
+                        "p99_ms": latency.percentile(99) * 1000,
+                    }
+                    for name, latency in latencies.items()
+                }
+        finally:
+            await pool.close()
+
+    if args.save:
+        params = {"sizes": args.sizes, "repeat": args.repeat, "cached": args.cached}
+        for previous in previous_runs(args.save, params):
+            print(f"\n{previous['commit']}:")
+            for size, commands in previous["results"].items():
+                p50s = " ".join(
+                    f"{name} {r['p50_ms']:.2f}ms" for name, r in commands.items()
+                )
+                print(f"  {size}: p50 {p50s}")
+        save(
+            args.save,
+            {"commit": current_commit(), "params": params, "results": results},
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -7,7 +7,9 @@ import traceback
 import sys
 
 import config
-from cogs.utils.parser import parse_language
+from cogs.utils.language_pool import LanguagePool
+from cogs.utils.loop_monitor import LoopMonitor
+from cogs.utils.profiler import Profiler
 
 timezone = pytz.timezone("Europe/London")
 
@@ -49,7 +51,7 @@ def dynamic_prefix(bot, message):
 
 
 class Cirilla(commands.Bot):
-    def __init__(self, pool):
+    def __init__(self, pool, *, read_pool=None, write_pool=None):
         super().__init__(
             command_prefix=dynamic_prefix, description=description, intents=intents
         )
@@ -57,8 +59,27 @@ class Cirilla(commands.Bot):
         self.case_insensitive = True
         self.add_listener(safe_message)
         self.pool = pool
+        # Stats reads its commands from read_pool and ingests through write_pool
+        self.read_pool = read_pool or pool
+        self.write_pool = write_pool or pool
+        self.language_pool = LanguagePool(
+            mode=getattr(config, "parse_mode", "inline"),
+            threshold=getattr(config, "parse_offload_threshold", 1000),
+            max_pending=getattr(config, "parse_max_pending", 64),
+            workers=getattr(config, "parse_workers", 2),
+        )
+        self.profiler = Profiler(
+            enabled=getattr(config, "profiling", False),
+            slow_threshold=getattr(config, "profiling_slow_threshold", 0.5),
+        )
+        self.loop_monitor = LoopMonitor(
+            lambda: self.latency,
+            interval=getattr(config, "loop_monitor_interval", 0.1),
+            threshold=getattr(config, "loop_lag_threshold", 0.25),
+        )
 
     async def setup_hook(self):
+        self.loop_monitor.start()
         app = await self.application_info()
         self.owner_id = app.owner.id
         self.client_id = app.id
@@ -123,19 +144,36 @@ class Cirilla(commands.Bot):
         await self.change_presence(activity=discord.CustomActivity(",,help"))
 
     async def on_resumed(self):
-        log.info("resumed...")
+        self.loop_monitor.resumes += 1
+        log.info(
+            f"resumed... (loop lag max {self.loop_monitor.lag.max * 1000:.0f}ms, "
+            f"{self.loop_monitor.stalls} stalls)"
+        )
 
     async def on_message(self, message):
         if message.author.bot:  # no bots
             return
         if message.guild is None:  # no PMs
             return
-        lang, escaped, emojis = parse_language(message)
+        lang, escaped, emojis = await self.language_pool.parse(message)
         self.dispatch(
             "safe_message", message, lang=lang, escaped=escaped, emojis=emojis
         )
         await self.process_commands(message)
 
+    # Every listener, cogs' included, runs through here
+    async def _run_event(self, coro, event_name, *args, **kwargs):
+        if not self.profiler.enabled:
+            return await super()._run_event(coro, event_name, *args, **kwargs)
+        with self.profiler.measure(coro.__qualname__):
+            await super()._run_event(coro, event_name, *args, **kwargs)
+
+    async def invoke(self, ctx):
+        if not self.profiler.enabled or ctx.command is None:
+            return await super().invoke(ctx)
+        with self.profiler.measure(f"command {ctx.command.qualified_name}"):
+            await super().invoke(ctx)
+
     async def process_commands(self, message):
         if message.author.bot:
             return
@@ -152,6 +190,8 @@ class Cirilla(commands.Bot):
     async def close(self):
         log.info(f"closing...")
         await super().close()
+        self.loop_monitor.stop()
+        self.language_pool.shutdown()
 
     @property
     def config(self):
@@ -13,6 +13,7 @@ from cogs.utils.ui import button_ban
 from cogs.utils.dropdown import send_dropdown
 from cogs.utils.modal import send_modal
 from cogs.utils.app_commands import init_ejlx_commands, delete_ejlx_commands
+from cogs.utils.queries import registry
 
 
 class Owner(commands.Cog):
@@ -122,6 +123,71 @@ class Owner(commands.Cog):
             if stderr:
                 await ctx.send("Error:\n" + stderr)
 
+    @commands.command(aliases=["pstats"])
+    async def parse_stats(self, ctx):
+        await ctx.send(f"```{self.bot.language_pool.summary()}```")
+
+    @commands.command(aliases=["istats"])
+    async def ingest_stats(self, ctx):
+        stats = self.bot.get_cog("Stats")
+        if stats is None:
+            await ctx.send("Stats cog is not loaded")
+            return
+        await ctx.send(f"```{stats.ingest_summary()}```")
+
+    @commands.command(aliases=["cstats"])
+    async def cache_stats(self, ctx):
+        stats = self.bot.get_cog("Stats")
+        if stats is None:
+            await ctx.send("Stats cog is not loaded")
+            return
+        await ctx.send(f"```{stats.query_summary()}```")
+
+    @commands.command(aliases=["qstats"])
+    async def query_stats(self, ctx):
+        async with self.bot.read_pool.acquire() as conn:
+            prepared = len(getattr(conn, "statements", ()))
+        await ctx.send(
+            f"```{registry.summary()}\n{prepared} prepared on a read pool connection```"
+        )
+
+    @commands.command(aliases=["dbstats"])
+    async def pool_stats(self, ctx):
+        pools = {self.pool, self.bot.read_pool, self.bot.write_pool}
+        summaries = [pool.summary() for pool in pools if hasattr(pool, "summary")]
+        if not summaries:
+            await ctx.send("The pools aren't monitored")
+            return
+        summaries.sort()
+        await ctx.send("```" + "\n\n".join(summaries)[:1994] + "```")
+
+    @commands.command(aliases=["prof"])
+    async def profile(self, ctx, action=""):
+        """Usage: ,profile [on|off|reset|slow]"""
+        profiler = self.bot.profiler
+        if action == "on":
+            profiler.enabled = True
+            profiler.reset()
+        elif action == "off":
+            profiler.enabled = False
+        elif action == "reset":
+            profiler.reset()
+        elif action == "slow":
+            await ctx.send(f"```{profiler.slow_summary()[-1994:]}```")
+            return
+        await ctx.send(f"```{profiler.summary()[:1994]}```")
+
+    @commands.command(aliases=["lag"])
+    async def loop_stats(self, ctx, action=""):
+        """Usage: ,loop_stats [stacks|reset]"""
+        monitor = self.bot.loop_monitor
+        if action == "stacks":
+            await ctx.send(f"```{monitor.incident_summary()[-1994:]}```")
+            return
+        if action == "reset":
+            monitor.reset()
+        await ctx.send(f"```{monitor.summary()[:1994]}```")
+
     @commands.command(hidden=True, name="eval")
     async def _eval(self, ctx, *, body: str):
         """Evaluates a code"""
@@ -1,10 +1,12 @@
 from discord.ext import commands, tasks
 import discord
 from collections import Counter, defaultdict
+from collections.abc import Iterable
 import logging
 import asyncio
 import asyncpg
 import re
+import time
 from datetime import datetime, date, timedelta
 from .utils.parser import REGEX_CUSTOM_EMOJIS, REGEX_BOT_COMMANDS, format_timedelta
 from .utils.resolver import (
@@ -15,12 +17,320 @@ from .utils.resolver import (
     resolve_options,
     get_text_channel_id,
 )
-from .utils.leaderboard import PaginatedLeaderboard
+from .utils.leaderboard import (
+    PaginatedLeaderboard,
+    QueryPageSource,
+    RankingPageSource,
+    ranking_statements,
+)
+from .utils.queries import registry
+from .utils.journal import StatsJournal, KIND_MESSAGE, KIND_EMOJI
+from .utils.flush_scheduler import FlushScheduler
+from .utils.batch_buffers import DoubleBuffer
+from .utils.query_cache import QueryCache
+from .utils.single_flight import SingleFlight
+from .utils.rank_index import GuildRanking, LeaderboardIndex
+from .utils.role_index import RoleIndex
 from .utils.parser import JP_EMOJI, EN_EMOJI, OL_EMOJI
 from .ejlx import NJ_ROLE
 
 log = logging.getLogger(__name__)
 
+# Rows asyncpg could not encode, it subclasses InterfaceError so it is caught first
+ENCODING_ERRORS = (asyncpg.exceptions._base.DataError,)
+# Failures where the same batch is expected to succeed later, so its rows are requeued
+RETRYABLE_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.InterfaceError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.OperatorInterventionError,
+    asyncpg.InsufficientResourcesError,
+    asyncpg.TransactionRollbackError,
+)
+# Errors that skip a round of partition maintenance instead of ending the loop
+MAINTENANCE_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.PostgresError,
+    asyncpg.InterfaceError,
+)
+# How often batch_update checks whether FlushScheduler wants a flush
+FLUSH_CHECK_INTERVAL = 1.0
+MAX_RETRY_DELAY = 600.0
+# Days of messages / emojis / voice kept, each day is its own partition
+RETENTION_DAYS = 30
+PARTITION_DAYS_AHEAD = 7
+# The leaderboard index misses expired days until it is reloaded from user_totals
+INDEX_RELOAD_INTERVAL = 3600.0
+# Longest a partition detach waits for its lock, reads queue behind it meanwhile
+DETACH_LOCK_TIMEOUT = "2s"
+INDEX_RETRY_DELAY = 60.0
+# Days shown by ,ac / ,cac / ,sac
+ACTIVITY_DAYS = 30
+
+# Column order of the row tuples built by batch_rows
+MESSAGE_COLUMNS = [
+    "guild_id",
+    "channel_id",
+    "user_id",
+    "lang",
+    "utc_date",
+    "message_count",
+]
+EMOJI_COLUMNS = ["guild_id", "user_id", "emoji", "utc_date", "emoji_count"]
+VOICE_COLUMNS = ["guild_id", "user_id", "utc_date", "minute_count"]
+
+
+# Statements of the commands, prepared on every pool connection (see QueryRegistry).
+# All of them take the guild id as $1.
+MESSAGES_FOR_USERS = registry.add(
+    "messages_for_users",
+    """
+    SELECT user_id, SUM(message_count) as count
+    FROM messages
+    WHERE guild_id = $1 AND user_id = ANY ($2::BIGINT[])
+    GROUP BY user_id
+    """,
+)
+
+USER_TOP_EMOJIS = registry.add(
+    "user_top_emojis",
+    """
+    SELECT emoji, SUM(emoji_count) as count
+    FROM emojis
+    WHERE guild_id = $1 AND user_id = $2
+    GROUP BY emoji
+    ORDER BY count DESC
+    LIMIT 3
+    """,
+)
+
+USER_VOICE_MINUTES = registry.add(
+    "user_voice_minutes",
+    """
+    SELECT SUM(minute_count) as count
+    FROM voice
+    WHERE guild_id = $1 AND user_id = $2
+    """,
+)
+
+USER_MESSAGES = registry.add(
+    "user_messages",
+    """
+    WITH records AS (
+        SELECT channel_id, lang, message_count, utc_date
+        FROM messages
+        WHERE guild_id = $1 AND user_id = $2 AND channel_id != ALL ($3::BIGINT[])
+    )
+        (
+            SELECT NULL::BIGINT AS channel_id, NULL::LANGTYPE AS lang, SUM(message_count) AS count
+            FROM records
+        ) UNION ALL
+        (
+            SELECT NULL, lang, SUM(message_count) AS count
+            FROM records
+            GROUP BY lang
+        ) UNION ALL
+        (
+            SELECT channel_id, NULL, SUM(message_count) AS count
+            FROM records
+            GROUP BY channel_id
+        ) UNION ALL 
+        (
+            SELECT NULL, NULL, SUM(message_count) as count
+            FROM records
+            WHERE utc_date > (current_date - '7 days'::interval)
+        )
+    """,
+)
+
+JAPANESE_LEADERBOARD = registry.add(
+    "japanese_leaderboard",
+    """
+    SELECT user_id, 100.0 * jp / (jp + en) AS jp_ratio
+    FROM user_totals
+    WHERE guild_id = $1 AND jp + en > $2
+    ORDER BY jp_ratio DESC
+    """,
+)
+
+ENGLISH_LEADERBOARD = registry.add(
+    "english_leaderboard",
+    """
+    SELECT user_id, 100.0 * en / (jp + en) AS en_ratio
+    FROM user_totals
+    WHERE guild_id = $1 AND jp + en > $2
+    ORDER BY en_ratio DESC
+    """,
+)
+
+EMOJI_USERS_LEADERBOARD = registry.add(
+    "emoji_users_leaderboard",
+    """
+    WITH emoji_counts AS (
+        SELECT emoji, SUM(count) as count, COUNT(user_id) AS spread
+        FROM (
+            SELECT emoji, user_id, SUM(emoji_count) as count
+            FROM emojis
+            WHERE guild_id = $1
+            GROUP BY emoji, user_id
+            ORDER BY count DESC
+        ) AS el
+        GROUP BY emoji
+    )
+        (
+           SELECT *, RANK() OVER (ORDER BY spread DESC) from emoji_counts
+        )
+    """,
+)
+
+EMOJI_LEADERBOARD = registry.add(
+    "emoji_leaderboard",
+    """
+    SELECT *, RANK() OVER (ORDER BY count DESC)
+    FROM (
+        SELECT emoji, SUM(emoji_count) as count
+        FROM emojis
+        WHERE guild_id = $1
+        GROUP BY emoji
+    ) AS el
+    """,
+)
+
+EMOJI_USAGE_LEADERBOARD = registry.add(
+    "emoji_usage_leaderboard",
+    """
+    WITH ranked AS (
+        SELECT *, RANK() OVER (ORDER BY count DESC)
+        FROM (
+            SELECT user_id, SUM(emoji_count) as count
+            FROM emojis
+            WHERE guild_id = $1 AND emoji = $2 
+            GROUP BY user_id
+            ORDER BY count DESC
+        ) AS el
+    )
+        (
+            SELECT * FROM ranked
+        ) UNION ALL
+        (
+            SELECT * FROM ranked WHERE user_id = $3
+        )
+    """,
+)
+
+# The activity series are kept per day by bulk_insert, see MESSAGE_TOTALS_SQL
+USER_ACTIVITY = registry.add(
+    "user_activity",
+    """
+    SELECT message_count AS count, utc_date
+    FROM user_daily_totals
+    WHERE guild_id = $1 AND user_id = $2
+    """,
+)
+
+CHANNEL_ACTIVITY = registry.add(
+    "channel_activity",
+    """
+    SELECT SUM(message_count) AS count, utc_date
+    FROM channel_daily_totals
+    WHERE guild_id = $1 AND channel_id = ANY ($2::BIGINT[])
+    GROUP BY utc_date
+    """,
+)
+
+SERVER_ACTIVITY = registry.add(
+    "server_activity",
+    """
+    SELECT message_count AS count, utc_date
+    FROM guild_daily_totals
+    WHERE guild_id = $1
+    """,
+)
+
+
+# The ranking queries below select user_id, count and rank and have a variant
+# limited to the members of a role, see Stats.role_args
+def ranking_variants(name, sql, role_param):
+    role_filter = f"AND user_id = ANY (${role_param}::BIGINT[])"
+    return (
+        ranking_statements(registry, name, sql.format(role_filter="")),
+        ranking_statements(
+            registry, f"{name}_role", sql.format(role_filter=role_filter)
+        ),
+    )
+
+
+LEADERBOARD, LEADERBOARD_ROLE = ranking_variants(
+    "leaderboard",
+    """
+    SELECT user_id, total AS count, RANK() OVER(ORDER BY total DESC)
+    FROM user_totals
+    WHERE guild_id = $1 {role_filter}
+    """,
+    2,
+)
+CHANNEL_LEADERBOARD, CHANNEL_LEADERBOARD_ROLE = ranking_variants(
+    "channel_leaderboard",
+    """
+    SELECT *, RANK() OVER (ORDER BY count DESC)
+    FROM (
+        SELECT user_id, SUM(total) as count
+        FROM channel_user_totals
+        WHERE guild_id = $1 AND channel_id = ANY ($2::BIGINT[]) {role_filter}
+        GROUP BY user_id
+    ) AS cl
+    """,
+    3,
+)
+VOICE_LEADERBOARD, VOICE_LEADERBOARD_ROLE = ranking_variants(
+    "voice_leaderboard",
+    """
+    SELECT user_id, minute_count AS count, RANK() OVER (ORDER BY minute_count DESC)
+    FROM voice_totals
+    WHERE guild_id = $1 {role_filter}
+    """,
+    2,
+)
+EMOJI_PERCENTILE_LEADERBOARD = registry.add(
+    "emoji_percentile_leaderboard",
+    """
+    WITH emoji_counts AS (
+        SELECT emoji, PERCENTILE_DISC($2::FLOAT) WITHIN GROUP(ORDER BY count) AS median, COUNT(user_id) AS spread
+        FROM (
+            SELECT emoji, user_id, SUM(emoji_count) as count
+            FROM emojis
+            WHERE guild_id = $1
+            GROUP BY emoji, user_id
+            ORDER BY count DESC
+        ) AS el
+        GROUP BY emoji
+    )
+        (
+           SELECT *, RANK() OVER (ORDER BY median DESC) from emoji_counts
+        )
+    """,
+)
+LEADERBOARD_INDEX = registry.add(
+    "leaderboard_index", "SELECT guild_id, user_id, total FROM user_totals"
+)
+
+
+def query_key(method, statement, guild_id, args):
+    # Array arguments come as lists, dict keys etc, which aren't hashable
+    return (
+        method,
+        statement.name,
+        guild_id,
+        *(
+            tuple(a)
+            if isinstance(a, Iterable) and not isinstance(a, (str, bytes))
+            else a
+            for a in args
+        ),
+    )
+
 
 def is_vc(voice_state):
     return (
@@ -31,17 +341,79 @@ def is_vc(voice_state):
     )
 
 
+def format_activity(title, records, use_numbers):
+    """
+    Chart of the past 30 days (UTC) from (count, utc_date) records, as message
+    counts with `use_numbers` or as bars of up to 15 ticks otherwise.
+    """
+    first_day = discord.utils.utcnow().date() - timedelta(days=ACTIVITY_DAYS - 1)
+    counts = [0] * ACTIVITY_DAYS
+    for record in records:
+        index = (record["utc_date"] - first_day).days
+        if 0 <= index < ACTIVITY_DAYS:
+            counts[index] += record["count"]
+
+    lines = [f"{title}\n```"]
+    if use_numbers:
+        for index, count in enumerate(counts):
+            day = first_day + timedelta(days=index)
+            lines.append(f"{day:%b %d(%a)}: {count}")
+    else:
+        max_num = max(counts)
+        lines.append(f"Unit: {max_num // 15} messages")
+        for index, count in enumerate(counts):
+            day = first_day + timedelta(days=index)
+            bar = "-" * (15 * count // max_num) if count else ""
+            lines.append(f"{day:%b %d(%a)}: {bar}".rstrip())
+    lines.append("```")
+    return "\n".join(lines)
+
+
 class Stats(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.settings = bot.settings
-        self.pool = bot.pool
+        # Commands read from read_pool (possibly a replica), ingestion and
+        # retention write through write_pool so flushes don't hold up commands
+        self.read_pool = bot.read_pool
+        self.write_pool = bot.write_pool
         self.config = bot.config
         self.in_vc = defaultdict(dict)
-        self._temp_messages = defaultdict(int)
-        self._temp_emojis = defaultdict(Counter)
-        self._temp_voice = defaultdict(int)
+        # Listeners write without locking, see DoubleBuffer
+        self.counters = DoubleBuffer()
+        # Serializes flushes with journal replay
         self._batch_lock = asyncio.Lock()
+        # Journal segments whose rows are buffered but not in Postgres yet
+        self._pending_segments = []
+        self._flush_failures = 0
+        self._next_flush_attempt = 0.0
+        self.max_buffered_rows = getattr(
+            self.config, "stats_max_buffered_rows", 200_000
+        )
+        self.rows_requeued = 0
+        self.rows_dropped = 0
+        # "unnest" sends composite arrays, "copy" streams through the staging tables
+        self.ingest_mode = getattr(self.config, "stats_ingest_mode", "unnest")
+        self.scheduler = FlushScheduler(
+            interval=getattr(self.config, "stats_flush_interval", 20.0),
+            max_interval=getattr(self.config, "stats_flush_max_interval", 120.0),
+            high_water=getattr(self.config, "stats_flush_high_water", 50_000),
+            target_latency=getattr(self.config, "stats_flush_target_latency", 1.0),
+        )
+        # Shared across cog reloads so recovered segments are only replayed once
+        # Closed in cog_unload, after the final flush, so a reload starts a new one
+        self.journal = StatsJournal(
+            getattr(self.config, "stats_journal_dir", "stats_journal")
+        )
+        self.query_cache = QueryCache(
+            ttl=getattr(self.config, "stats_cache_ttl", 60.0),
+            max_rows=getattr(self.config, "stats_cache_max_rows", 100_000),
+        )
+        self.in_flight = SingleFlight()
+        # Answers ,lb without SQL, see reload_leaderboard_index
+        self.leaderboard_index = LeaderboardIndex()
+        self._next_index_reload = float("inf")
+        self.role_index = RoleIndex()
         self.batch_update.add_exception_type(asyncpg.PostgresConnectionError)
         self.batch_update.add_exception_type(asyncpg.CardinalityViolationError)  # why
         self.batch_update.start()
@@ -56,19 +428,44 @@ class Stats(commands.Cog):
                         if is_vc(member.voice):
                             vc[member.id] = datetime.utcnow()
 
+    # Every Stats statement takes the guild id as $1, which is what the cache is grouped by
+    async def fetch(self, statement, guild_id, *args):
+        return await self.query("fetch", statement, guild_id, args)
+
+    async def fetchval(self, statement, guild_id, *args):
+        return await self.query("fetchval", statement, guild_id, args)
+
+    async def query(self, method, statement, guild_id, args):
+        key = query_key(method, statement, guild_id, args)
+        run = getattr(registry, method)
+
+        # Concurrent misses share one query. Callers arriving after new rows were
+        # written don't join a query that started before.
+        def load():
+            return self.in_flight.do(
+                (key, self.query_cache.generation(guild_id)),
+                lambda: run(self.read_pool, statement, guild_id, *args),
+            )
+
+        return await self.query_cache.get(guild_id, key, load)
+
+    def query_summary(self):
+        return f"{self.query_cache.summary()}\n{self.in_flight.summary()}"
+
     async def get_messages_for_users(self, guild_id, user_ids):
-        records = await self.pool.fetch(
-            """
-            SELECT user_id, SUM(message_count) as count
-            FROM messages
-            WHERE guild_id = $1 AND user_id = ANY ($2::BIGINT[])
-            GROUP BY user_id
-        """,
+        records = await self.fetch(
+            MESSAGES_FOR_USERS,
             guild_id,
-            user_ids,
+            list(user_ids),
         )
         return records
 
+    def role_args(self, role):
+        """Extra argument of the _ROLE ranking statements, the member ids of `role`."""
+        if not role:
+            return ()
+        return (sorted(self.role_index.members(role)),)
+
     @commands.command(aliases=["u", "uinfo"])
     async def user(self, ctx, *, arg=None):
         user_id = ctx.author.id
@@ -84,54 +481,18 @@ class Stats(commands.Cog):
             mod_channels = []
 
         emoji_data, voice, message_data = await asyncio.gather(
-            self.pool.fetch(
-                """
-                SELECT emoji, SUM(emoji_count) as count
-                FROM emojis
-                WHERE guild_id = $1 AND user_id = $2
-                GROUP BY emoji
-                ORDER BY count DESC
-                LIMIT 3
-                """,
+            self.fetch(
+                USER_TOP_EMOJIS,
                 ctx.guild.id,
                 user_id,
             ),
-            self.pool.fetchval(
-                """
-                SELECT SUM(minute_count) as count
-                FROM voice
-                WHERE guild_id = $1 AND user_id = $2
-                """,
+            self.fetchval(
+                USER_VOICE_MINUTES,
                 ctx.guild.id,
                 user_id,
             ),
-            self.pool.fetch(
-                """
-                WITH records AS (
-                    SELECT channel_id, lang, message_count, utc_date
-                    FROM messages
-                    WHERE guild_id = $1 AND user_id = $2 AND channel_id != ALL ($3::BIGINT[])
-                )
-                    (
-                        SELECT NULL::BIGINT AS channel_id, NULL::LANGTYPE AS lang, SUM(message_count) AS count
-                        FROM records
-                    ) UNION ALL
-                    (
-                        SELECT NULL, lang, SUM(message_count) AS count
-                        FROM records
-                        GROUP BY lang
-                    ) UNION ALL
-                    (
-                        SELECT channel_id, NULL, SUM(message_count) AS count
-                        FROM records
-                        GROUP BY channel_id
-                    ) UNION ALL 
-                    (
-                        SELECT NULL, NULL, SUM(message_count) as count
-                        FROM records
-                        WHERE utc_date > (current_date - '7 days'::interval)
-                    )
-                """,
+            self.fetch(
+                USER_MESSAGES,
                 ctx.guild.id,
                 user_id,
                 mod_channels,
@@ -294,56 +655,32 @@ class Stats(commands.Cog):
                 await ctx.send("Invalid role name")
                 return
 
-        lb = await self.pool.fetch(
-            """
-            WITH ranked AS (
-                SELECT *, RANK() OVER(ORDER BY count DESC)
-                FROM (
-                    SELECT user_id, SUM(message_count) AS count
-                    FROM messages
-                    WHERE guild_id = $1
-                    GROUP BY user_id
-                ) AS lb
+        if self.leaderboard_index.seeded and not role:
+            ranking = self.leaderboard_index.get(ctx.guild.id) or GuildRanking()
+            source = RankingPageSource(ranking)
+            user_record = ranking.record(user_id)
+        else:
+            source = QueryPageSource(
+                self,
+                LEADERBOARD_ROLE if role else LEADERBOARD,
+                ctx.guild.id,
+                *self.role_args(role),
             )
-                (
-                    SELECT * FROM ranked
-                ) UNION ALL
-                (
-                    SELECT * FROM ranked WHERE user_id = $2
-                )
-            """,
-            ctx.guild.id,
-            user_id,
-        )
+            user_record = await source.find(user_id)
 
         # No messages in the server
-        if not lb:
+        if not await source.count():
             await ctx.send("No messages found")
             return
 
-        if lb[-1]["user_id"] != user_id:
-            records = lb
-            user_record = None
-        else:
-            records = lb[:-1]
-            user_record = lb[-1]
-
         title = "Leaderboard"
 
         if role:
             title += f" with role: {role.name}"
 
-            def hasRole(uid):
-                member = ctx.guild.get_member(uid)
-                if not member:
-                    return False
-                return any([r == role for r in member.roles])
-
-            records = [r for r in records if hasRole(r["user_id"])]
-
         leaderboard = PaginatedLeaderboard(
             ctx,
-            records=records,
+            source=source,
             title=title,
             description="Number of messages in the past 30 days (UTC)",
             find_record=user_record,
@@ -363,30 +700,15 @@ class Stats(commands.Cog):
 
         if not channel_ids:
             channel_ids = [get_text_channel_id(ctx.channel)]
-        chlb = await self.pool.fetch(
-            """
-            WITH ranked AS (
-                SELECT *, RANK() OVER (ORDER BY count DESC)
-                FROM (
-                    SELECT user_id, SUM(message_count) as count
-                    FROM messages
-                    WHERE guild_id = $1 AND channel_id = ANY ($2::BIGINT[])
-                    GROUP BY user_id
-                    ORDER BY count DESC
-                ) AS cl
-            )
-                (
-                    SELECT * FROM ranked
-                ) UNION ALL
-                (
-                    SELECT * FROM ranked WHERE user_id = $3
-                )
-            """,
+        source = QueryPageSource(
+            self,
+            CHANNEL_LEADERBOARD_ROLE if role else CHANNEL_LEADERBOARD,
             ctx.guild.id,
             channel_ids,
-            user_id,
+            *self.role_args(role),
         )
-        if not chlb:
+        count, user_record = await asyncio.gather(source.count(), source.find(user_id))
+        if not count:
             await ctx.send("No messages found")
             return
 
@@ -401,27 +723,12 @@ class Stats(commands.Cog):
             channel_names.append(ch_name)
         title += ",".join(channel_names)
 
-        if chlb[-1]["user_id"] != user_id:
-            records = chlb
-            user_record = None
-        else:
-            records = chlb[:-1]
-            user_record = chlb[-1]
-
         if role:
             title += f" with role: {role.name}"  # type: ignore
 
-            def hasRole(uid):
-                member = ctx.guild.get_member(uid)
-                if not member:
-                    return False
-                return any([r == role for r in member.roles])
-
-            records = [r for r in records if hasRole(r["user_id"])]
-
         leaderboard = PaginatedLeaderboard(
             ctx,
-            records=records,
+            source=source,
             title=title[:256],
             description="Number of messages in the past 30 days (UTC)",
             find_record=user_record,
@@ -435,21 +742,8 @@ class Stats(commands.Cog):
         except:
             limit = 500
 
-        records = await self.pool.fetch(
-            """
-            WITH lang_usage AS (
-                SELECT user_id, COALESCE(SUM(CASE WHEN lang = 'JP' THEN message_count END),0) as jp_count, SUM(message_count) as total
-                FROM messages
-                WHERE guild_id = $1 AND lang IN ('EN', 'JP')
-                GROUP BY user_id
-                HAVING SUM(message_count) > $2
-            )
-                (
-                    SELECT user_id, 100.0 * jp_count / total AS jp_ratio
-                    FROM lang_usage
-                    ORDER BY jp_ratio DESC
-                )
-            """,
+        records = await self.fetch(
+            JAPANESE_LEADERBOARD,
             ctx.guild.id,
             limit,
         )
@@ -490,21 +784,8 @@ class Stats(commands.Cog):
         except:
             limit = 300
 
-        records = await self.pool.fetch(
-            """
-            WITH lang_usage AS (
-                SELECT user_id, COALESCE(SUM(CASE WHEN lang = 'EN' THEN message_count END),0) as en_count, SUM(message_count) as total
-                FROM messages
-                WHERE guild_id = $1 AND lang IN ('EN', 'JP')
-                GROUP BY user_id
-                HAVING SUM(message_count) > $2
-            )
-                (
-                    SELECT user_id, 100.0 * en_count / total AS en_ratio
-                    FROM lang_usage
-                    ORDER BY en_ratio DESC
-                )
-            """,
+        records = await self.fetch(
+            ENGLISH_LEADERBOARD,
             ctx.guild.id,
             limit,
         )
@@ -571,56 +852,17 @@ class Stats(commands.Cog):
                     percentile = 0.5
             except:
                 percentile = 0.5
-            records = await self.pool.fetch(
-                f"""
-                WITH emoji_counts AS (
-                    SELECT emoji, PERCENTILE_DISC({percentile}) WITHIN GROUP(ORDER BY count) AS median, COUNT(user_id) AS spread
-                    FROM (
-                        SELECT emoji, user_id, SUM(emoji_count) as count
-                        FROM emojis
-                        WHERE guild_id = $1
-                        GROUP BY emoji, user_id
-                        ORDER BY count DESC
-                    ) AS el
-                    GROUP BY emoji
-                )
-                    (
-                       SELECT *, RANK() OVER (ORDER BY median DESC) from emoji_counts
-                    )
-                """,
-                ctx.guild.id,
+            records = await self.fetch(
+                EMOJI_PERCENTILE_LEADERBOARD, ctx.guild.id, float(percentile)
             )
         elif users:
-            records = await self.pool.fetch(
-                """
-                WITH emoji_counts AS (
-                    SELECT emoji, SUM(count) as count, COUNT(user_id) AS spread
-                    FROM (
-                        SELECT emoji, user_id, SUM(emoji_count) as count
-                        FROM emojis
-                        WHERE guild_id = $1
-                        GROUP BY emoji, user_id
-                        ORDER BY count DESC
-                    ) AS el
-                    GROUP BY emoji
-                )
-                    (
-                       SELECT *, RANK() OVER (ORDER BY spread DESC) from emoji_counts
-                    )
-                """,
+            records = await self.fetch(
+                EMOJI_USERS_LEADERBOARD,
                 ctx.guild.id,
             )
         else:
-            records = await self.pool.fetch(
-                """
-                SELECT *, RANK() OVER (ORDER BY count DESC)
-                FROM (
-                    SELECT emoji, SUM(emoji_count) as count
-                    FROM emojis
-                    WHERE guild_id = $1
-                    GROUP BY emoji
-                ) AS el
-                """,
+            records = await self.fetch(
+                EMOJI_LEADERBOARD,
                 ctx.guild.id,
             )
 
@@ -669,25 +911,8 @@ class Stats(commands.Cog):
         await leaderboard.build()
 
     async def emoji_usage_leaderboard(self, ctx, emoji):
-        records = await self.pool.fetch(
-            """
-            WITH ranked AS (
-                SELECT *, RANK() OVER (ORDER BY count DESC)
-                FROM (
-                    SELECT user_id, SUM(emoji_count) as count
-                    FROM emojis
-                    WHERE guild_id = $1 AND emoji = $2 
-                    GROUP BY user_id
-                    ORDER BY count DESC
-                ) AS el
-            )
-                (
-                    SELECT * FROM ranked
-                ) UNION ALL
-                (
-                    SELECT * FROM ranked WHERE user_id = $3
-                )
-            """,
+        records = await self.fetch(
+            EMOJI_USAGE_LEADERBOARD,
             ctx.guild.id,
             emoji,
             ctx.author.id,
@@ -722,40 +947,17 @@ class Stats(commands.Cog):
             if not role:
                 await ctx.send("Invalid role name")
                 return
-        vl = await self.pool.fetch(
-            """
-            WITH ranked AS (
-                SELECT *, RANK() OVER (ORDER BY count DESC)
-                FROM (
-                    SELECT user_id, SUM(minute_count) as count
-                    FROM voice
-                    WHERE guild_id = $1
-                    GROUP BY user_id
-                    ORDER BY count DESC
-                ) AS vl
-            )
-                (
-                    SELECT * FROM ranked
-                ) UNION ALL
-                (
-                    SELECT * FROM ranked WHERE user_id = $2
-                )
-            """,
+        source = QueryPageSource(
+            self,
+            VOICE_LEADERBOARD_ROLE if role else VOICE_LEADERBOARD,
             ctx.guild.id,
-            user_id,
+            *self.role_args(role),
         )
-
-        if not vl:
+        count, user_record = await asyncio.gather(source.count(), source.find(user_id))
+        if not count:
             await ctx.send("No voice usage data found")
             return
 
-        if vl[-1]["user_id"] != user_id:
-            records = vl
-            user_record = None
-        else:
-            records = vl[:-1]
-            user_record = vl[-1]
-
         def count_to_string(c):
             hrs = c // 60
             mns = c % 60
@@ -765,17 +967,9 @@ class Stats(commands.Cog):
         if role:
             title += f" with role: {role.name}"
 
-            def hasRole(uid):
-                member = ctx.guild.get_member(uid)
-                if not member:
-                    return False
-                return any([r == role for r in member.roles])
-
-            records = [r for r in records if hasRole(r["user_id"])]
-
         leaderboard = PaginatedLeaderboard(
             ctx,
-            records=records,
+            source=source,
             title=title,
             description="Time spent in VC in the past 30 days (UTC)",
             find_record=user_record,
@@ -786,147 +980,39 @@ class Stats(commands.Cog):
     @commands.command(aliases=["ac", "uac"])
     async def user_activity(self, ctx, *, arg=""):
         user = ctx.author
-        use_numbers = "-n" in arg
-        ac = await self.pool.fetch(
-            """
-            SELECT SUM(message_count) as count, utc_date
-            FROM messages
-            WHERE guild_id = $1 AND user_id = $2
-            GROUP BY utc_date
-            ORDER BY utc_date ASC
-            """,
+        ac = await self.fetch(
+            USER_ACTIVITY,
             ctx.guild.id,
             user.id,
         )
-        s = f"Server activity for **{user}**\n```\n"
-        if use_numbers:
-            prev_date = discord.utils.utcnow().date() - timedelta(days=29)
-            for record in ac:
-                date = record["utc_date"]
-                if date < prev_date:
-                    continue
-                while date > prev_date:
-                    s += prev_date.strftime(f"%b %d(%a): 0\n")
-                    prev_date += timedelta(days=1)
-                prev_date += timedelta(days=1)
-                count = record["count"]
-                s += date.strftime(f"%b %d(%a): {count}\n")
-        else:
-            max_num = max(ac, key=lambda r: r["count"])["count"]
-            s += f"Unit: {max_num // 15} messages\n"
-            prev_date = discord.utils.utcnow().date() - timedelta(days=29)
-            for record in ac:
-                date = record["utc_date"]
-                if date < prev_date:
-                    continue
-                while date > prev_date:
-                    s += prev_date.strftime(f"%b %d(%a):\n")
-                    prev_date += timedelta(days=1)
-                prev_date += timedelta(days=1)
-                count = record["count"]
-                ticks = 15 * count // max_num
-                bar = "-" * ticks
-                s += date.strftime(f"%b %d(%a): {bar}\n")
-
-        s += "```"
-        await ctx.send(s)
+        await ctx.send(
+            format_activity(f"Server activity for **{user}**", ac, "-n" in arg)
+        )
 
     @commands.command(aliases=["cac", "chac"])
     async def channel_activity(self, ctx, *, arg=""):
         channel_ids = [c.id for c in ctx.message.channel_mentions]
-        use_numbers = "-n" in arg
         if not channel_ids:
             channel_ids = [get_text_channel_id(ctx.channel)]
-        ac = await self.pool.fetch(
-            """
-            SELECT SUM(message_count) as count, utc_date
-            FROM messages
-            WHERE guild_id = $1 AND channel_id = ANY ($2::BIGINT[])
-            GROUP BY utc_date
-            ORDER BY utc_date ASC
-            """,
+        ac = await self.fetch(
+            CHANNEL_ACTIVITY,
             ctx.guild.id,
             channel_ids,
         )
         channels = [ctx.guild.get_channel(cid).name for cid in channel_ids]
-        s = f'Server activity for {", ".join(channels)}\n```\n'
-        if use_numbers:
-            prev_date = discord.utils.utcnow().date() - timedelta(days=29)
-            for record in ac:
-                date = record["utc_date"]
-                if date < prev_date:
-                    continue
-                while date > prev_date:
-                    s += prev_date.strftime(f"%b %d(%a): 0\n")
-                    prev_date += timedelta(days=1)
-                prev_date += timedelta(days=1)
-                count = record["count"]
-                s += date.strftime(f"%b %d(%a): {count}\n")
-        else:
-            max_num = max(ac, key=lambda r: r["count"])["count"]
-            s += f"Unit: {max_num // 15} messages\n"
-            prev_date = discord.utils.utcnow().date() - timedelta(days=29)
-            for record in ac:
-                date = record["utc_date"]
-                if date < prev_date:
-                    continue
-                while date > prev_date:
-                    s += prev_date.strftime(f"%b %d(%a):\n")
-                    prev_date += timedelta(days=1)
-                prev_date += timedelta(days=1)
-                count = record["count"]
-                ticks = 15 * count // max_num
-                bar = "-" * ticks
-                s += date.strftime(f"%b %d(%a): {bar}\n")
-
-        s += "```"
-        await ctx.send(s)
+        await ctx.send(
+            format_activity(
+                f'Server activity for {", ".join(channels)}', ac, "-n" in arg
+            )
+        )
 
     @commands.command(aliases=["sac"])
     async def server_activity(self, ctx, *, arg=""):
-        use_numbers = "-n" in arg
-        ac = await self.pool.fetch(
-            """
-            SELECT SUM(message_count) as count, utc_date
-            FROM messages
-            WHERE guild_id = $1
-            GROUP BY utc_date
-            ORDER BY utc_date ASC
-            """,
+        ac = await self.fetch(
+            SERVER_ACTIVITY,
             ctx.guild.id,
         )
-        s = f"Server activity\n```\n"
-        if use_numbers:
-            prev_date = discord.utils.utcnow().date() - timedelta(days=29)
-            for record in ac:
-                date = record["utc_date"]
-                if date < prev_date:
-                    continue
-                while date > prev_date:
-                    s += prev_date.strftime(f"%b %d(%a): 0\n")
-                    prev_date += timedelta(days=1)
-                prev_date += timedelta(days=1)
-                count = record["count"]
-                s += date.strftime(f"%b %d(%a): {count}\n")
-        else:
-            max_num = max(ac, key=lambda r: r["count"])["count"]
-            s += f"Unit: {max_num // 15} messages\n"
-            prev_date = discord.utils.utcnow().date() - timedelta(days=29)
-            for record in ac:
-                date = record["utc_date"]
-                if date < prev_date:
-                    continue
-                while date > prev_date:
-                    s += prev_date.strftime(f"%b %d(%a):\n")
-                    prev_date += timedelta(days=1)
-                prev_date += timedelta(days=1)
-                count = record["count"]
-                ticks = 15 * count // max_num
-                bar = "-" * ticks
-                s += date.strftime(f"%b %d(%a): {bar}\n")
-
-        s += "```"
-        await ctx.send(s)
+        await ctx.send(format_activity("Server activity", ac, "-n" in arg))
 
     @commands.Cog.listener()
     async def on_safe_message(self, m, **kwargs):
@@ -936,38 +1022,50 @@ class Stats(commands.Cog):
         custom_emoji_matches = REGEX_CUSTOM_EMOJIS.findall(m.content)
         emojis = custom_emoji_matches + kwargs["emojis"]
 
-        async with self._batch_lock:
-            self._temp_messages[
-                (
-                    m.guild.id,
-                    get_text_channel_id(m.channel),
-                    m.author.id,
-                    lang,
-                    m.created_at.date(),
-                )
-            ] += 1
-            if emojis:
-                self._temp_emojis[
-                    (m.guild.id, m.author.id, m.created_at.date())
-                ] += Counter(emojis)
+        message_key = (
+            m.guild.id,
+            get_text_channel_id(m.channel),
+            m.author.id,
+            lang,
+            m.created_at.date(),
+        )
+        counters = self.counters.active
+        counters.messages[message_key] += 1
+        self.journal.record_message(message_key)
+        if emojis:
+            emoji_key = (m.guild.id, m.author.id, m.created_at.date())
+            emoji_counter = Counter(emojis)
+            counters.emojis[emoji_key] += emoji_counter
+            self.journal.record_emojis(emoji_key, emoji_counter)
 
     @commands.Cog.listener()
     async def on_voice_state_update(self, member, before, after):
-        async with self._batch_lock:
-            vc = self.in_vc[member.guild.id]
-            if not is_vc(before) and is_vc(after):
-                vc[member.id] = datetime.utcnow()
-                # TODO: Unmute people who are in the unmute queue?
-            elif is_vc(before) and not is_vc(after):
-                if member.id in vc:
-                    self.add_to_temp_vc(member.id, member.guild.id, vc)
+        vc = self.in_vc[member.guild.id]
+        if not is_vc(before) and is_vc(after):
+            vc[member.id] = datetime.utcnow()
+            # TODO: Unmute people who are in the unmute queue?
+        elif is_vc(before) and not is_vc(after):
+            if member.id in vc:
+                self.add_to_temp_vc(member.id, member.guild.id, vc)
 
     @commands.Cog.listener()
     async def on_member_remove(self, member):
-        async with self._batch_lock:
-            vc = self.in_vc[member.guild.id]
-            if member.id in vc:
-                self.add_to_temp_vc(member.id, member.guild.id, vc)
+        self.role_index.remove_member(member)
+        vc = self.in_vc[member.guild.id]
+        if member.id in vc:
+            self.add_to_temp_vc(member.id, member.guild.id, vc)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        self.role_index.add_member(member)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before, after):
+        self.role_index.update_member(before, after)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        self.role_index.remove_role(role)
 
     @commands.Cog.listener()
     async def on_reaction_add(self, reaction, user):
@@ -981,100 +1079,218 @@ class Stats(commands.Cog):
         emoji = str(reaction.emoji)
         if emoji in [JP_EMOJI, EN_EMOJI, OL_EMOJI]:
             return
-        today = datetime.utcnow().date()
-        async with self._batch_lock:
-            self._temp_emojis[(reaction.message.guild.id, user.id, today)][emoji] += 1
+        emoji_key = (reaction.message.guild.id, user.id, datetime.utcnow().date())
+        self.counters.active.emojis[emoji_key][emoji] += 1
+        self.journal.record_emojis(emoji_key, {emoji: 1})
 
     # Add current members in VC
     @commands.Cog.listener()
     async def on_ready(self):
         log.info("statistics on_ready")
-        async with self._batch_lock:
-            for guild in self.bot.guilds:
-                vc = self.in_vc[guild.id]
-                for vcs in guild.voice_channels:
-                    for member in vcs.members:
-                        if is_vc(member.voice):
-                            vc[member.id] = datetime.utcnow()
+        # Member events may have been missed while disconnected
+        self.role_index.clear()
+        for guild in self.bot.guilds:
+            vc = self.in_vc[guild.id]
+            for vcs in guild.voice_channels:
+                for member in vcs.members:
+                    if is_vc(member.voice):
+                        vc[member.id] = datetime.utcnow()
 
     @commands.Cog.listener()
     async def on_disconnect(self):
         # flush people in VC now
         log.info("statistics on_disconnect")
-        async with self._batch_lock:
-            for guild_id, vc in self.in_vc.items():
-                for mem_id in vc:
-                    self.add_to_temp_vc(mem_id, guild_id, vc, delete=False)
-            self.in_vc.clear()
+        for guild_id, vc in self.in_vc.items():
+            for mem_id in vc:
+                self.add_to_temp_vc(mem_id, guild_id, vc, delete=False)
+        self.in_vc.clear()
 
-    def cog_unload(self):
+    async def cog_unload(self):
         log.info("statistics unloading")
         self.batch_update.cancel()
+        # after_loop does the final flush inside the task
+        task = self.batch_update.get_task()
+        if task is not None:
+            await asyncio.wait({task})
+        self.journal.close()
 
-    # Needs to have _batch_lock
     def add_to_temp_vc(self, member_id, guild_id, vc, *, delete=True):
         now = datetime.utcnow()
         elapsed_mins = (now - vc[member_id]).total_seconds() / 60
         if delete:
             del vc[member_id]
-        self._temp_voice[(guild_id, member_id, now.date())] += elapsed_mins
+        voice_key = (guild_id, member_id, now.date())
+        self.counters.active.voice[voice_key] += elapsed_mins
+        self.journal.record_voice(voice_key, elapsed_mins)
 
     # Needs to have _batch_lock
     def do_batch(self):
-        messages = []
-        for (
-            guild_id,
-            channel_id,
-            user_id,
-            lang,
-            date,
-        ), count in self._temp_messages.items():
-            messages.append(
-                {
-                    "guild_id": guild_id,
-                    "channel_id": channel_id,
-                    "user_id": user_id,
-                    "lang": lang,
-                    "utc_date": date,
-                    "message_count": count,
-                }
+        """Swap counter generations, rows are built from the old one by batch_rows"""
+        # No await between the two, so the segment holds exactly this generation's deltas
+        generation = self.counters.swap()
+        segment = self.journal.rotate()
+        return generation, segment
+
+    # Needs to have _batch_lock
+    def replay_journal(self):
+        segments = self.journal.recovered
+        self.journal.recovered = []
+        if not segments:
+            return []
+        replayed = 0
+        counters = self.counters.active
+        for kind, key, value in self.journal.replay(segments):
+            if kind == KIND_MESSAGE:
+                counters.messages[key] += value
+            elif kind == KIND_EMOJI:
+                counters.emojis[key[:3]][key[3]] += value
+            else:
+                counters.voice[key] += value
+            replayed += 1
+        log.info(f"Replayed {replayed} records from {len(segments)} journal segments")
+        return segments
+
+    def buffered_rows(self):
+        return self.counters.active.rows()
+
+    # Needs to have _batch_lock
+    def requeue(self, messages, emojis, voices):
+        """
+        Merge rows of a failed batch back into the buffers. Rows for keys that are
+        already buffered always fit, new keys are dropped past max_buffered_rows.
+        Requeued rows are journaled again in the current segment, dropped ones are
+        not, so the batch's old segments can be committed.
+        """
+        counters = self.counters.active
+        room = self.max_buffered_rows - counters.rows()
+        requeued = dropped = 0
+        for *key, count in messages:
+            key = tuple(key)
+            if key in counters.messages or room > 0:
+                room -= key not in counters.messages
+                counters.messages[key] += count
+                self.journal.record_message(key, count)
+                requeued += 1
+            else:
+                dropped += 1
+        for guild_id, user_id, emoji, utc_date, count in emojis:
+            key = (guild_id, user_id, utc_date)
+            counter = counters.emojis[key]
+            if emoji in counter or room > 0:
+                room -= emoji not in counter
+                counter[emoji] += count
+                self.journal.record_emojis(key, {emoji: count})
+                requeued += 1
+            else:
+                dropped += 1
+            if not counter:
+                del counters.emojis[key]
+        for *key, minutes in voices:
+            key = tuple(key)
+            if key in counters.voice or room > 0:
+                room -= key not in counters.voice
+                counters.voice[key] += minutes
+                self.journal.record_voice(key, minutes)
+                requeued += 1
+            else:
+                dropped += 1
+        self.rows_requeued += requeued
+        self.rows_dropped += dropped
+        return requeued, dropped
+
+    def reject_batch(self, segments, rows):
+        # Retrying would fail the same way, and so would replaying the journal
+        self.rows_dropped += rows
+        self.journal.quarantine(segments)
+        log.exception(
+            f"bulk_insert rejected the batch, dropped {rows} rows, "
+            f"its journal segments are in {self.journal.quarantine_directory}"
+        )
+
+    async def flush(self):
+        async with self._batch_lock:
+            generation, segment = self.do_batch()
+        messages, emojis, voices = batch_rows(generation)
+        segments = [*self._pending_segments, segment]
+        self._pending_segments = []
+        rows = len(messages) + len(emojis) + len(voices)
+        if not rows:
+            self.journal.commit(segments)
+            return
+        start = time.perf_counter()
+        try:
+            await self.bulk_insert(messages, emojis, voices)
+        except ENCODING_ERRORS:
+            self.reject_batch(segments, rows)
+            return
+        except RETRYABLE_ERRORS as e:
+            self._flush_failures += 1
+            delay = min(
+                self.scheduler.base_interval * 2 ** (self._flush_failures - 1),
+                MAX_RETRY_DELAY,
             )
-        emojis = []
-        for (guild_id, user_id, date), emoji_counter in self._temp_emojis.items():
-            for emoji, emoji_count in emoji_counter.items():
-                emojis.append(
-                    {
-                        "guild_id": guild_id,
-                        "user_id": user_id,
-                        "emoji": emoji,
-                        "utc_date": date,
-                        "emoji_count": emoji_count,
-                    }
-                )
-        voices = []
-        for (guild_id, user_id, date), minutes in self._temp_voice.items():
-            voices.append(
-                {
-                    "guild_id": guild_id,
-                    "user_id": user_id,
-                    "utc_date": date,
-                    "minute_count": minutes,
-                }
+            self._next_flush_attempt = self.bot.loop.time() + delay
+            async with self._batch_lock:
+                requeued, dropped = self.requeue(messages, emojis, voices)
+            # The requeued rows are in the current segment now, synced before the old
+            # segments are removed
+            await self.journal.sync()
+            self.journal.commit(segments)
+            log.warning(
+                f"bulk_insert failed ({e.__class__.__name__}: {e}), requeued {requeued} rows, "
+                f"dropped {dropped} rows, retrying in {delay:.0f}s"
             )
-        self._temp_messages.clear()
-        self._temp_emojis.clear()
-        self._temp_voice.clear()
-        return messages, emojis, voices
+            return
+        except asyncpg.PostgresError:
+            self.reject_batch(segments, rows)
+            return
+        self.scheduler.record(rows, time.perf_counter() - start, self.bot.loop.time())
+        self._flush_failures = 0
+        self.journal.commit(segments)
+        self.leaderboard_index.apply(messages)
+        self.query_cache.invalidate(
+            {row[0] for table in (messages, emojis, voices) for row in table}
+        )
 
-    @tasks.loop(seconds=20.0)
+    @tasks.loop(seconds=FLUSH_CHECK_INTERVAL)
     async def batch_update(self):
-        async with self._batch_lock:
-            messages, emojis, voices = self.do_batch()
-        await self.bulk_insert(messages, emojis, voices)
+        await self.journal.sync()
+        now = self.bot.loop.time()
+        # Runs between flushes so the totals read match what was applied to the index
+        if now >= self._next_index_reload:
+            await self.reload_leaderboard_index()
+        if now < self._next_flush_attempt:
+            return
+        if self.scheduler.should_flush(self.buffered_rows(), now):
+            await self.flush()
 
     @batch_update.before_loop
     async def before_batch_update(self):
         log.info("bath_update starting...")
+        async with self._batch_lock:
+            self._pending_segments = self.replay_journal()
+        await self.reload_leaderboard_index()
+
+    async def reload_leaderboard_index(self):
+        now = self.bot.loop.time()
+        try:
+            # From the primary, a replica could still be missing the last flush
+            records = await registry.fetch(self.write_pool, LEADERBOARD_INDEX)
+        except Exception:
+            self._next_index_reload = now + INDEX_RETRY_DELAY
+            log.exception("Loading the leaderboard index failed")
+            return
+        self.leaderboard_index.load(records)
+        self._next_index_reload = now + INDEX_RELOAD_INTERVAL
+
+    def ingest_summary(self):
+        return (
+            f"buffered rows: {self.buffered_rows()}/{self.max_buffered_rows}\n"
+            f"consecutive failed flushes: {self._flush_failures}\n"
+            f"rows requeued: {self.rows_requeued}\n"
+            f"rows dropped: {self.rows_dropped}\n"
+            f"{self.scheduler.summary()}"
+        )
 
     @batch_update.after_loop
     async def on_batch_update_cancel(self):
@@ -1085,53 +1301,378 @@ class Stats(commands.Cog):
                 for mem_id in vc:
                     self.add_to_temp_vc(mem_id, guild_id, vc, delete=False)
             self.in_vc.clear()
-            messages, emojis, voices = self.do_batch()
-            await self.bulk_insert(messages, emojis, voices)
+            await self.flush()
 
+    # All three upserts share a transaction so a journal segment is either fully
+    # applied or not at all
     async def bulk_insert(self, messages, emojis, voices):
-        await asyncio.gather(
-            self.pool.execute(
-                """
-                INSERT INTO messages (guild_id, channel_id, user_id, lang, utc_date, message_count)
-                SELECT m.guild_id, m.channel_id, m.user_id, m.lang, m.utc_date, m.message_count
-                FROM UNNEST($1::messages[]) AS m
-                ON CONFLICT ON CONSTRAINT messages_pk DO UPDATE
-                SET message_count = messages.message_count + EXCLUDED.message_count
-                """,
-                messages,
-            ),
-            self.pool.execute(
-                """
-                INSERT INTO emojis (guild_id, user_id, emoji, utc_date, emoji_count)
-                SELECT e.guild_id, e.user_id, e.emoji, e.utc_date, e.emoji_count
-                FROM UNNEST($1::emojis[]) AS e
-                ON CONFLICT ON CONSTRAINT emojis_pk DO UPDATE
-                SET emoji_count = emojis.emoji_count + EXCLUDED.emoji_count
-                """,
-                emojis,
-            ),
-            self.pool.execute(
-                """
-                INSERT INTO voice (guild_id, user_id, utc_date, minute_count)
-                SELECT v.guild_id, v.user_id, v.utc_date, v.minute_count
-                FROM UNNEST($1::voice[]) AS v
-                ON CONFLICT ON CONSTRAINT voice_pk DO UPDATE
-                SET minute_count = voice.minute_count + EXCLUDED.minute_count
-                """,
-                voices,
-            ),
-        )
+        async with self.write_pool.acquire() as conn, conn.transaction():
+            if self.ingest_mode == "copy":
+                await upsert_copy(conn, messages, emojis, voices)
+            else:
+                await upsert_unnest(conn, messages, emojis, voices)
 
     @tasks.loop(hours=24)
     async def clear_old_records(self):
-        async with self._batch_lock:
-            await self.pool.execute(
-                """
-                DELETE FROM messages WHERE utc_date < NOW() - INTERVAL '30 days';
-                DELETE FROM emojis WHERE utc_date < NOW() - INTERVAL '30 days';
-                DELETE FROM voice WHERE utc_date < NOW() - INTERVAL '30 days';
-                """
+        # Only touches whole partitions, so ingestion keeps running meanwhile
+        today = datetime.utcnow().date()
+        # Tomorrow's partitions must exist even if dropping old ones fails, or its
+        # rows pile up in the default partitions
+        try:
+            failures = await self.write_pool.fetch(
+                "SELECT create_stats_partitions($1, $2) AS error",
+                today,
+                today + timedelta(days=PARTITION_DAYS_AHEAD),
+            )
+        except MAINTENANCE_ERRORS:
+            log.exception("Creating stats partitions failed")
+        else:
+            for record in failures:
+                log.error(f"Creating stats partition {record['error']}")
+        try:
+            async with self.write_pool.acquire() as conn:
+                dropped = await drop_expired_partitions(
+                    conn, today - timedelta(days=RETENTION_DAYS)
+                )
+        except MAINTENANCE_ERRORS:
+            log.exception("Dropping expired stats partitions failed")
+            return
+        if dropped:
+            self.query_cache.invalidate_all()
+            self._next_index_reload = 0.0
+            log.info(f"Dropped stats partitions for {len(dropped)} days")
+
+
+# Subtracts {expired} (a query returning messages / voice rows) from the rolling totals
+MESSAGE_TOTALS_EXPIRE_SQL = """
+    WITH expired AS (
+        {expired}
+    ), users AS (
+        UPDATE user_totals AS t
+        SET total = t.total - e.total, jp = t.jp - e.jp, en = t.en - e.en, ol = t.ol - e.ol
+        FROM (
+            SELECT guild_id, user_id, SUM(message_count) AS total,
+                COALESCE(SUM(message_count) FILTER (WHERE lang = 'JP'), 0) AS jp,
+                COALESCE(SUM(message_count) FILTER (WHERE lang = 'EN'), 0) AS en,
+                COALESCE(SUM(message_count) FILTER (WHERE lang = 'OL'), 0) AS ol
+            FROM expired
+            GROUP BY guild_id, user_id
+        ) AS e
+        WHERE t.guild_id = e.guild_id AND t.user_id = e.user_id
+    )
+    UPDATE channel_user_totals AS t
+    SET total = t.total - e.total
+    FROM (
+        SELECT guild_id, channel_id, user_id, SUM(message_count) AS total
+        FROM expired
+        GROUP BY guild_id, channel_id, user_id
+    ) AS e
+    WHERE t.guild_id = e.guild_id AND t.channel_id = e.channel_id AND t.user_id = e.user_id
+"""
+VOICE_TOTALS_EXPIRE_SQL = """
+    WITH expired AS (
+        {expired}
+    )
+    UPDATE voice_totals AS t
+    SET minute_count = t.minute_count - e.minute_count
+    FROM (
+        SELECT guild_id, user_id, SUM(minute_count) AS minute_count
+        FROM expired
+        GROUP BY guild_id, user_id
+    ) AS e
+    WHERE t.guild_id = e.guild_id AND t.user_id = e.user_id
+"""
+
+
+# Adds a batch to the rolling totals and the daily activity series, {source} is the
+# batch of messages / voice rows
+MESSAGE_TOTALS_SQL = """
+    WITH batch AS (
+        SELECT * FROM {source}
+    ), users AS (
+        INSERT INTO user_totals (guild_id, user_id, total, jp, en, ol)
+        SELECT guild_id, user_id, SUM(message_count),
+            COALESCE(SUM(message_count) FILTER (WHERE lang = 'JP'), 0),
+            COALESCE(SUM(message_count) FILTER (WHERE lang = 'EN'), 0),
+            COALESCE(SUM(message_count) FILTER (WHERE lang = 'OL'), 0)
+        FROM batch
+        GROUP BY guild_id, user_id
+        ON CONFLICT ON CONSTRAINT user_totals_pk DO UPDATE
+        SET total = user_totals.total + EXCLUDED.total,
+            jp = user_totals.jp + EXCLUDED.jp,
+            en = user_totals.en + EXCLUDED.en,
+            ol = user_totals.ol + EXCLUDED.ol
+    ), guild_days AS (
+        INSERT INTO guild_daily_totals (guild_id, utc_date, message_count)
+        SELECT guild_id, utc_date, SUM(message_count)
+        FROM batch
+        GROUP BY guild_id, utc_date
+        ON CONFLICT ON CONSTRAINT guild_daily_totals_pk DO UPDATE
+        SET message_count = guild_daily_totals.message_count + EXCLUDED.message_count
+    ), channel_days AS (
+        INSERT INTO channel_daily_totals (guild_id, channel_id, utc_date, message_count)
+        SELECT guild_id, channel_id, utc_date, SUM(message_count)
+        FROM batch
+        GROUP BY guild_id, channel_id, utc_date
+        ON CONFLICT ON CONSTRAINT channel_daily_totals_pk DO UPDATE
+        SET message_count = channel_daily_totals.message_count + EXCLUDED.message_count
+    ), user_days AS (
+        INSERT INTO user_daily_totals (guild_id, user_id, utc_date, message_count)
+        SELECT guild_id, user_id, utc_date, SUM(message_count)
+        FROM batch
+        GROUP BY guild_id, user_id, utc_date
+        ON CONFLICT ON CONSTRAINT user_daily_totals_pk DO UPDATE
+        SET message_count = user_daily_totals.message_count + EXCLUDED.message_count
+    )
+    INSERT INTO channel_user_totals (guild_id, channel_id, user_id, total)
+    SELECT guild_id, channel_id, user_id, SUM(message_count)
+    FROM batch
+    GROUP BY guild_id, channel_id, user_id
+    ON CONFLICT ON CONSTRAINT channel_user_totals_pk DO UPDATE
+    SET total = channel_user_totals.total + EXCLUDED.total
+"""
+VOICE_TOTALS_SQL = """
+    INSERT INTO voice_totals (guild_id, user_id, minute_count)
+    SELECT guild_id, user_id, SUM(minute_count)
+    FROM {source}
+    GROUP BY guild_id, user_id
+    ON CONFLICT ON CONSTRAINT voice_totals_pk DO UPDATE
+    SET minute_count = voice_totals.minute_count + EXCLUDED.minute_count
+"""
+
+
+def batch_rows(generation):
+    """Flatten a swapped out counter generation into row tuples in table column order."""
+    return (
+        [(*key, count) for key, count in generation.messages.items()],
+        [
+            (guild_id, user_id, emoji, utc_date, count)
+            for (guild_id, user_id, utc_date), counter in generation.emojis.items()
+            for emoji, count in counter.items()
+        ],
+        [(*key, minutes) for key, minutes in generation.voice.items()],
+    )
+
+
+UPSERT_MESSAGES_UNNEST = registry.add(
+    "upsert_messages_unnest",
+    """
+    INSERT INTO messages (guild_id, channel_id, user_id, lang, utc_date, message_count)
+    SELECT m.guild_id, m.channel_id, m.user_id, m.lang, m.utc_date, m.message_count
+    FROM UNNEST($1::messages[]) AS m
+    ON CONFLICT ON CONSTRAINT messages_pk DO UPDATE
+    SET message_count = messages.message_count + EXCLUDED.message_count
+    """,
+)
+UPSERT_EMOJIS_UNNEST = registry.add(
+    "upsert_emojis_unnest",
+    """
+    INSERT INTO emojis (guild_id, user_id, emoji, utc_date, emoji_count)
+    SELECT e.guild_id, e.user_id, e.emoji, e.utc_date, e.emoji_count
+    FROM UNNEST($1::emojis[]) AS e
+    ON CONFLICT ON CONSTRAINT emojis_pk DO UPDATE
+    SET emoji_count = emojis.emoji_count + EXCLUDED.emoji_count
+    """,
+)
+UPSERT_VOICE_UNNEST = registry.add(
+    "upsert_voice_unnest",
+    """
+    INSERT INTO voice (guild_id, user_id, utc_date, minute_count)
+    SELECT v.guild_id, v.user_id, v.utc_date, v.minute_count
+    FROM UNNEST($1::voice[]) AS v
+    ON CONFLICT ON CONSTRAINT voice_pk DO UPDATE
+    SET minute_count = voice.minute_count + EXCLUDED.minute_count
+    """,
+)
+MESSAGE_TOTALS_UNNEST = registry.add(
+    "message_totals_unnest",
+    MESSAGE_TOTALS_SQL.format(source="UNNEST($1::messages[])"),
+)
+VOICE_TOTALS_UNNEST = registry.add(
+    "voice_totals_unnest", VOICE_TOTALS_SQL.format(source="UNNEST($1::voice[])")
+)
+MERGE_MESSAGES_STAGING = registry.add(
+    "merge_messages_staging",
+    """
+    INSERT INTO messages (guild_id, channel_id, user_id, lang, utc_date, message_count)
+    SELECT guild_id, channel_id, user_id, lang, utc_date, message_count
+    FROM messages_staging
+    ON CONFLICT ON CONSTRAINT messages_pk DO UPDATE
+    SET message_count = messages.message_count + EXCLUDED.message_count
+    """,
+)
+MERGE_EMOJIS_STAGING = registry.add(
+    "merge_emojis_staging",
+    """
+    INSERT INTO emojis (guild_id, user_id, emoji, utc_date, emoji_count)
+    SELECT guild_id, user_id, emoji, utc_date, emoji_count
+    FROM emojis_staging
+    ON CONFLICT ON CONSTRAINT emojis_pk DO UPDATE
+    SET emoji_count = emojis.emoji_count + EXCLUDED.emoji_count
+    """,
+)
+MERGE_VOICE_STAGING = registry.add(
+    "merge_voice_staging",
+    """
+    INSERT INTO voice (guild_id, user_id, utc_date, minute_count)
+    SELECT guild_id, user_id, utc_date, minute_count
+    FROM voice_staging
+    ON CONFLICT ON CONSTRAINT voice_pk DO UPDATE
+    SET minute_count = voice.minute_count + EXCLUDED.minute_count
+    """,
+)
+MESSAGE_TOTALS_STAGING = registry.add(
+    "message_totals_staging", MESSAGE_TOTALS_SQL.format(source="messages_staging")
+)
+VOICE_TOTALS_STAGING = registry.add(
+    "voice_totals_staging", VOICE_TOTALS_SQL.format(source="voice_staging")
+)
+
+
+async def upsert_unnest(conn, messages, emojis, voices):
+    """Sends every batch as one composite-type array per table."""
+    if messages:
+        await registry.execute(conn, UPSERT_MESSAGES_UNNEST, messages)
+        await registry.execute(conn, MESSAGE_TOTALS_UNNEST, messages)
+    if emojis:
+        await registry.execute(conn, UPSERT_EMOJIS_UNNEST, emojis)
+    if voices:
+        await registry.execute(conn, UPSERT_VOICE_UNNEST, voices)
+        await registry.execute(conn, VOICE_TOTALS_UNNEST, voices)
+
+
+async def upsert_copy(conn, messages, emojis, voices):
+    """
+    Streams the batch into the unlogged *_staging tables with binary COPY, then merges
+    each staging table into its real table. Needs to run in a transaction.
+    """
+    if messages:
+        await conn.copy_records_to_table(
+            "messages_staging",
+            records=messages,
+            columns=MESSAGE_COLUMNS,
+        )
+        await registry.execute(conn, MERGE_MESSAGES_STAGING)
+        await registry.execute(conn, MESSAGE_TOTALS_STAGING)
+    if emojis:
+        await conn.copy_records_to_table(
+            "emojis_staging",
+            records=emojis,
+            columns=EMOJI_COLUMNS,
+        )
+        await registry.execute(conn, MERGE_EMOJIS_STAGING)
+    if voices:
+        await conn.copy_records_to_table(
+            "voice_staging",
+            records=voices,
+            columns=VOICE_COLUMNS,
+        )
+        await registry.execute(conn, MERGE_VOICE_STAGING)
+        await registry.execute(conn, VOICE_TOTALS_STAGING)
+    # Staging rows are only visible to this transaction, clear them before commit
+    await conn.execute("TRUNCATE messages_staging, emojis_staging, voice_staging")
+
+
+async def drop_expired_partitions(conn, cutoff):
+    """
+    Drop the daily messages / emojis / voice partitions up to and including `cutoff`,
+    subtracting them from the rolling totals first. Old rows that ended up in the
+    default partitions are deleted the same way, and so are the expired days of the
+    daily activity series. Returns the days dropped.
+
+    A day's partitions are detached in a transaction that does nothing else, which
+    locks the parents only briefly and never waits on a totals row, so it can't
+    deadlock with bulk_insert. (DETACH CONCURRENTLY isn't allowed next to the default
+    partitions.) The totals are then updated from the detached tables. Tables an
+    earlier run detached but didn't drop are finished the same way.
+    """
+    names = await conn.fetch(
+        """
+        SELECT c.relname, i.inhparent IS NOT NULL AS attached
+        FROM pg_class c LEFT JOIN pg_inherits i ON i.inhrelid = c.oid
+        WHERE c.relkind = 'r' AND pg_table_is_visible(c.oid)
+            AND c.relname ~ '^(messages|emojis|voice)_[0-9]{8}$'
+        """
+    )
+    days = {}
+    for r in names:
+        parent, suffix = r["relname"].rsplit("_", 1)
+        day = datetime.strptime(suffix, "%Y%m%d").date()
+        days.setdefault(day, {})[parent] = r["attached"]
+    dropped = []
+    for day in sorted(days):
+        if day > cutoff:
+            break
+        suffix = day.strftime("%Y%m%d")
+        tables = days[day]
+        # Same order as bulk_insert takes its locks
+        attached = [p for p in ("messages", "emojis", "voice") if tables.get(p)]
+        if attached:
+            try:
+                async with conn.transaction():
+                    await conn.execute(
+                        f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'"
+                    )
+                    for parent in attached:
+                        await conn.execute(
+                            f"ALTER TABLE {parent} DETACH PARTITION {parent}_{suffix}"
+                        )
+            except asyncpg.LockNotAvailableError:
+                log.warning(
+                    f"Timed out detaching the {suffix} partitions, retrying later"
+                )
+                break
+        async with conn.transaction():
+            if "messages" in tables:
+                await conn.execute(
+                    MESSAGE_TOTALS_EXPIRE_SQL.format(
+                        expired=f"SELECT * FROM messages_{suffix}"
+                    )
+                )
+            if "voice" in tables:
+                await conn.execute(
+                    VOICE_TOTALS_EXPIRE_SQL.format(
+                        expired=f"SELECT * FROM voice_{suffix}"
+                    )
+                )
+            await conn.execute(
+                ";".join(f"DROP TABLE {parent}_{suffix}" for parent in tables)
+            )
+        dropped.append(day)
+
+    async with conn.transaction():
+        await conn.execute(
+            MESSAGE_TOTALS_EXPIRE_SQL.format(
+                expired="DELETE FROM messages_default WHERE utc_date <= $1 RETURNING *"
+            ),
+            cutoff,
+        )
+        await conn.execute(
+            VOICE_TOTALS_EXPIRE_SQL.format(
+                expired="DELETE FROM voice_default WHERE utc_date <= $1 RETURNING *"
+            ),
+            cutoff,
+        )
+        await conn.execute("DELETE FROM emojis_default WHERE utc_date <= $1", cutoff)
+        await conn.execute(
+            """
+            DELETE FROM user_totals WHERE total <= 0;
+            DELETE FROM channel_user_totals WHERE total <= 0;
+            DELETE FROM voice_totals WHERE minute_count <= 0;
+            """
+        )
+        await conn.execute(
+            """
+            WITH guild_days AS (
+                DELETE FROM guild_daily_totals WHERE utc_date <= $1
+            ), channel_days AS (
+                DELETE FROM channel_daily_totals WHERE utc_date <= $1
             )
+            DELETE FROM user_daily_totals WHERE utc_date <= $1
+            """,
+            cutoff,
+        )
+    return dropped
 
 
 async def setup(bot):
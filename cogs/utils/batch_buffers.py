@@ -0,0 +1,40 @@
+from collections import Counter, defaultdict
+
+
+class Generation:
+    """One generation of Stats counters, keyed like the journal records."""
+
+    __slots__ = ("messages", "emojis", "voice")
+
+    def __init__(self):
+        # (guild_id, channel_id, user_id, lang, utc_date) -> count
+        self.messages = defaultdict(int)
+        # (guild_id, user_id, utc_date) -> Counter of emojis
+        self.emojis = defaultdict(Counter)
+        # (guild_id, user_id, utc_date) -> minutes
+        self.voice = defaultdict(int)
+
+    def rows(self):
+        return (
+            len(self.messages)
+            + sum(len(c) for c in self.emojis.values())
+            + len(self.voice)
+        )
+
+
+class DoubleBuffer:
+    """
+    Double-buffered counters for the Stats listeners.
+
+    Writers increment `active` directly, without a lock. Everything runs on one event
+    loop and an increment never awaits, so nothing can run between reading `active`
+    and writing to it. swap() installs a fresh generation in a single assignment and
+    hands the previous one to the flusher, which owns it from then on.
+    """
+
+    def __init__(self):
+        self.active = Generation()
+
+    def swap(self):
+        previous, self.active = self.active, Generation()
+        return previous
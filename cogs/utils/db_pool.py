@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+import asyncpg
+
+from .metrics import Histogram, LatencyTracker
+from .queries import StatementConnection
+
+log = logging.getLogger(__name__)
+
+# Bounds of the acquire wait histogram, in seconds
+ACQUIRE_WAIT_BOUNDS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class MonitoredPool(asyncpg.Pool):
+    """
+    asyncpg pool that records how long acquiring a connection waits, how long
+    connections are held, and which queries run longer than `slow_query_threshold`
+    seconds.
+
+    Hold times are measured for `async with pool.acquire()` blocks, a bare
+    `await pool.acquire()` only counts towards the acquire wait.
+
+    asyncpg itself recycles connections: after `max_queries` queries, and after
+    `max_inactive_connection_lifetime` seconds idle. `connections_opened` counts
+    every (re)connect.
+    """
+
+    def __init__(self, *args, name, slow_query_threshold, **kwargs):
+        self.name = name
+        self.slow_query_threshold = slow_query_threshold
+        self.max_queries = kwargs["max_queries"]
+        self.max_idle = kwargs["max_inactive_connection_lifetime"]
+        self.acquire_wait = Histogram(ACQUIRE_WAIT_BOUNDS)
+        self.acquire_latency = LatencyTracker()
+        self.hold_time = LatencyTracker()
+        self.waiting = 0
+        self.max_waiting = 0
+        self.acquire_timeouts = 0
+        self.connections_opened = 0
+        self.slow_queries = 0
+        self.recent_slow_queries = deque(maxlen=5)
+        self._user_init = kwargs["init"]
+        kwargs["init"] = self._init_connection
+        super().__init__(*args, **kwargs)
+
+    async def _init_connection(self, conn):
+        self.connections_opened += 1
+        conn.add_query_logger(self._observe_query)
+        if self._user_init is not None:
+            await self._user_init(conn)
+
+    def _observe_query(self, record):
+        seconds = record.elapsed
+        if seconds < self.slow_query_threshold:
+            return
+        self.slow_queries += 1
+        query = " ".join(record.query.split())
+        self.recent_slow_queries.append((seconds, query[:100]))
+        log.warning(f"Slow query on {self.name} pool ({seconds:.2f}s): {query[:300]}")
+
+    def acquire(self, *, timeout=None):
+        return TimedAcquireContext(self, super().acquire(timeout=timeout))
+
+    async def _timed_acquire(self, acquiring):
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        start = time.perf_counter()
+        try:
+            connection = await acquiring
+        except asyncio.TimeoutError:
+            self.acquire_timeouts += 1
+            raise
+        finally:
+            self.waiting -= 1
+        waited = time.perf_counter() - start
+        self.acquire_wait.add(waited)
+        self.acquire_latency.add(waited)
+        return connection
+
+    def summary(self):
+        size = self.get_size()
+        idle = self.get_idle_size()
+        lines = [
+            f"[{self.name}] connections: {size - idle} in use, {idle} idle "
+            f"(min {self.get_min_size()}, max {self.get_max_size()}), "
+            f"{self.connections_opened} opened",
+            f"recycled after {self.max_queries} queries or {self.max_idle:.0f}s idle",
+            f"waiting: {self.waiting} now, {self.max_waiting} peak, "
+            f"{self.acquire_timeouts} timeouts",
+            f"acquire wait: {self.acquire_latency.summary()}",
+            f"  {self.acquire_wait.summary()}",
+            f"held: {self.hold_time.summary()}",
+            f"slow queries (>={self.slow_query_threshold:g}s): {self.slow_queries}",
+        ]
+        lines += [
+            f"  {seconds:.2f}s {query}" for seconds, query in self.recent_slow_queries
+        ]
+        return "\n".join(lines)
+
+
+class TimedAcquireContext:
+    """Wraps asyncpg's acquire context, the hold time lives on it, not the pool."""
+
+    __slots__ = ("pool", "context", "acquired_at")
+
+    def __init__(self, pool, context):
+        self.pool = pool
+        self.context = context
+        self.acquired_at = None
+
+    async def __aenter__(self):
+        connection = await self.pool._timed_acquire(self.context.__aenter__())
+        self.acquired_at = time.perf_counter()
+        return connection
+
+    async def __aexit__(self, *exc_info):
+        try:
+            await self.context.__aexit__(*exc_info)
+        finally:
+            self.pool.hold_time.add(time.perf_counter() - self.acquired_at)
+
+    def __await__(self):
+        return self.pool._timed_acquire(self.context).__await__()
+
+
+def create_pool(
+    dsn=None,
+    *,
+    name="db",
+    slow_query_threshold=1.0,
+    min_size=10,
+    max_size=10,
+    max_queries=50000,
+    max_inactive_connection_lifetime=300.0,
+    setup=None,
+    init=None,
+    loop=None,
+    connection_class=StatementConnection,
+    record_class=asyncpg.Record,
+    **connect_kwargs,
+):
+    """asyncpg.create_pool() for a MonitoredPool, with the same defaults."""
+    return MonitoredPool(
+        dsn,
+        name=name,
+        slow_query_threshold=slow_query_threshold,
+        min_size=min_size,
+        max_size=max_size,
+        max_queries=max_queries,
+        max_inactive_connection_lifetime=max_inactive_connection_lifetime,
+        setup=setup,
+        init=init,
+        loop=loop,
+        connection_class=connection_class,
+        record_class=record_class,
+        **connect_kwargs,
+    )
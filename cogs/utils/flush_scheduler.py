@@ -0,0 +1,72 @@
+from collections import deque
+
+from .metrics import LatencyTracker
+
+
+class FlushScheduler:
+    """
+    Decides when Stats flushes its batch buffers.
+
+    Flushes happen every `interval` seconds, or right away once `high_water` rows
+    are buffered. Empty flushes are skipped. When bulk_insert gets slower than
+    `target_latency`, the interval is stretched (up to `max_interval`) so that
+    the database gets fewer, larger batches.
+    """
+
+    def __init__(
+        self,
+        *,
+        interval=20.0,
+        max_interval=120.0,
+        high_water=50_000,
+        target_latency=1.0,
+    ):
+        self.base_interval = interval
+        self.interval = interval
+        self.max_interval = max_interval
+        self.high_water = high_water
+        self.target_latency = target_latency
+        self.last_flush = 0.0
+        self.latency = LatencyTracker(size=200)
+        self.sizes = deque(maxlen=200)
+        self.early_flushes = 0
+        self.skipped_flushes = 0
+        self._smoothed_latency = None
+
+    def should_flush(self, buffered_rows, now):
+        due = now - self.last_flush >= self.interval
+        if buffered_rows == 0:
+            if due:
+                self.skipped_flushes += 1
+                self.last_flush = now
+            return False
+        if buffered_rows >= self.high_water:
+            self.early_flushes += 1
+            return True
+        return due
+
+    def record(self, rows, seconds, now):
+        self.last_flush = now
+        self.sizes.append(rows)
+        self.latency.add(seconds)
+        if self._smoothed_latency is None:
+            self._smoothed_latency = seconds
+        else:
+            self._smoothed_latency = 0.3 * seconds + 0.7 * self._smoothed_latency
+        stretch = max(1.0, self._smoothed_latency / self.target_latency)
+        self.interval = min(self.max_interval, self.base_interval * stretch)
+
+    def summary(self):
+        sizes = list(self.sizes)
+        size_str = (
+            f"last {sizes[-1]}, avg {sum(sizes) // len(sizes)}, max {max(sizes)}"
+            if sizes
+            else "none yet"
+        )
+        return (
+            f"interval: {self.interval:.1f}s (base {self.base_interval:.0f}s, max {self.max_interval:.0f}s)\n"
+            f"high water: {self.high_water} rows ({self.early_flushes} early flushes)\n"
+            f"skipped empty flushes: {self.skipped_flushes}\n"
+            f"flush sizes: {size_str}\n"
+            f"flush latency: {self.latency.summary()}"
+        )
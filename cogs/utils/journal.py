@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+log = logging.getLogger(__name__)
+
+KIND_MESSAGE = 1
+KIND_EMOJI = 2
+KIND_VOICE = 3
+
+LANGS = ("OL", "JP", "EN")
+LANG_IDS = {lang: i for i, lang in enumerate(LANGS)}
+
+# Every record is a header (payload length, crc32 of payload) followed by the payload.
+# Payloads start with the kind and store dates as ordinals.
+HEADER = struct.Struct("<HI")
+MESSAGE = struct.Struct("<BqqqBIi")  # guild, channel, user, lang, date, count
+EMOJI = struct.Struct("<BqqIi")  # guild, user, date, count, then the utf-8 emoji
+VOICE = struct.Struct("<BqqId")  # guild, user, date, minutes
+
+SUFFIX = ".journal"
+# Subdirectory for segments of batches Postgres rejected, never replayed
+QUARANTINE = "quarantine"
+
+
+def _frame(payload):
+    return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+class StatsJournal:
+    """
+    Append-only spill file for the Stats batch buffers.
+
+    Every delta applied to the in-memory buffers is framed into a write buffer, and
+    sync() writes and fsyncs it to the current segment (group commit), so a crash
+    of the process or the host loses at most the deltas since the last sync.
+    When the buffers are drained the segment is rotated, and it is only deleted once
+    the upsert for that batch succeeded. Segments left over from a previous process
+    are kept in `recovered` so they can be replayed at startup.
+
+    File operations run in order on a single writer thread, off the event loop.
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.quarantine_directory = os.path.join(directory, QUARANTINE)
+        self.recovered = self.segments()
+        self._sequence = 0
+        if self.recovered:
+            last = os.path.basename(self.recovered[-1])
+            self._sequence = int(last[: -len(SUFFIX)]) + 1
+        self._writer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="stats_journal"
+        )
+        self._buffer = []
+        self._file = None
+        self._open()
+
+    def segments(self):
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(SUFFIX))
+        return [os.path.join(self.directory, n) for n in names]
+
+    def _open(self):
+        path = os.path.join(self.directory, f"{self._sequence:012d}{SUFFIX}")
+        self._sequence += 1
+        self._file = open(path, "ab")
+
+    @staticmethod
+    def _write(f, data, close=False):
+        if data:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if close:
+            f.close()
+
+    def _take_buffer(self):
+        data = b"".join(self._buffer)
+        self._buffer.clear()
+        return data
+
+    async def sync(self):
+        """Write and fsync the deltas buffered since the last sync."""
+        if not self._buffer:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            self._writer, self._write, self._file, self._take_buffer()
+        )
+
+    def record_message(self, key, count=1):
+        guild_id, channel_id, user_id, lang, utc_date = key
+        payload = MESSAGE.pack(
+            KIND_MESSAGE,
+            guild_id,
+            channel_id,
+            user_id,
+            LANG_IDS[lang],
+            utc_date.toordinal(),
+            count,
+        )
+        self._buffer.append(_frame(payload))
+
+    def record_emojis(self, key, counter):
+        guild_id, user_id, utc_date = key
+        day = utc_date.toordinal()
+        self._buffer.append(
+            b"".join(
+                _frame(
+                    EMOJI.pack(KIND_EMOJI, guild_id, user_id, day, count)
+                    + emoji.encode()
+                )
+                for emoji, count in counter.items()
+            )
+        )
+
+    def record_voice(self, key, minutes):
+        guild_id, user_id, utc_date = key
+        payload = VOICE.pack(
+            KIND_VOICE, guild_id, user_id, utc_date.toordinal(), minutes
+        )
+        self._buffer.append(_frame(payload))
+
+    def rotate(self):
+        """Start a new segment and return the path of the finished one."""
+        path = self._file.name
+        self._writer.submit(self._write, self._file, self._take_buffer(), close=True)
+        self._open()
+        return path
+
+    def commit(self, paths):
+        """The deltas in these segments are in Postgres, so they can go."""
+        self._writer.submit(self._remove, paths)
+
+    def quarantine(self, paths):
+        """These segments hold a batch Postgres rejected, keep them for inspection."""
+        self._writer.submit(self._move, paths, self.quarantine_directory)
+
+    @staticmethod
+    def _move(paths, directory):
+        os.makedirs(directory, exist_ok=True)
+        for path in paths:
+            try:
+                os.replace(path, os.path.join(directory, os.path.basename(path)))
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _remove(paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def replay(self, paths):
+        """
+        Yields (kind, key, value) for every intact record in the segments.
+        Emoji keys are (guild_id, user_id, utc_date, emoji).
+        A torn record at the end of a segment (crash mid-write) stops that segment.
+        """
+        for path in paths:
+            with open(path, "rb") as f:
+                data = f.read()
+            offset = 0
+            while offset < len(data):
+                if offset + HEADER.size > len(data):
+                    log.warning(f"Truncated record header in {path}")
+                    break
+                length, crc = HEADER.unpack_from(data, offset)
+                offset += HEADER.size
+                payload = data[offset : offset + length]
+                offset += length
+                if len(payload) != length or zlib.crc32(payload) != crc:
+                    log.warning(f"Corrupt record in {path}, skipping the rest")
+                    break
+                yield self._decode(payload)
+
+    def _decode(self, payload):
+        kind = payload[0]
+        if kind == KIND_MESSAGE:
+            _, guild_id, channel_id, user_id, lang, day, count = MESSAGE.unpack(payload)
+            key = (guild_id, channel_id, user_id, LANGS[lang], date.fromordinal(day))
+            return kind, key, count
+        if kind == KIND_EMOJI:
+            _, guild_id, user_id, day, count = EMOJI.unpack_from(payload)
+            emoji = payload[EMOJI.size :].decode()
+            return kind, (guild_id, user_id, date.fromordinal(day), emoji), count
+        _, guild_id, user_id, day, minutes = VOICE.unpack(payload)
+        return kind, (guild_id, user_id, date.fromordinal(day)), minutes
+
+    def close(self):
+        self._writer.submit(self._write, self._file, self._take_buffer(), close=True)
+        self._writer.shutdown(wait=True)
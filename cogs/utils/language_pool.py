@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .metrics import LatencyTracker
+from .parser import parse_content
+
+log = logging.getLogger(__name__)
+
+MODES = ("inline", "thread", "process")
+
+
+class LanguagePool:
+    """
+    Runs parse_language for incoming messages.
+
+    Messages shorter than `threshold` characters are classified inline. Longer ones
+    go to a thread or process pool so a burst of huge pastes does not block the
+    event loop. At most `max_pending` offloaded messages are in the executor; further
+    ones wait for a slot, still off the loop, and the waits are counted.
+    """
+
+    def __init__(self, *, mode="inline", threshold=1000, max_pending=64, workers=2):
+        if mode not in MODES:
+            raise ValueError(f"Unknown parse mode {mode}, must be one of {MODES}")
+        self.mode = mode
+        self.threshold = threshold
+        self.max_pending = max_pending
+        if mode == "thread":
+            self.executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="parse_language"
+            )
+        elif mode == "process":
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self.executor = None
+        self._slots = asyncio.Semaphore(max_pending)
+        self.pending = 0
+        self.peak_pending = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.slot_wait = LatencyTracker()
+        self.inline_latency = LatencyTracker()
+        self.offload_latency = LatencyTracker()
+
+    async def parse(self, message):
+        content = message.content
+        if self.executor is None or len(content) < self.threshold:
+            with self.inline_latency.time():
+                return parse_content(content)
+
+        start = time.perf_counter()
+        if self._slots.locked():
+            self.waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+            try:
+                with self.slot_wait.time():
+                    await self._slots.acquire()
+            finally:
+                self.waiting -= 1
+        else:
+            await self._slots.acquire()
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, parse_content, content)
+        finally:
+            self.pending -= 1
+            self._slots.release()
+            self.offload_latency.add(time.perf_counter() - start)
+
+    def shutdown(self):
+        if self.executor is not None:
+            log.info("shutting down language pool")
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def summary(self):
+        return (
+            f"mode: {self.mode} (offload >= {self.threshold} chars)\n"
+            f"queue: {self.pending} pending, {self.max_pending} slots (peak {self.peak_pending})\n"
+            f"waiting for a slot: {self.waiting} now, {self.peak_waiting} peak, "
+            f"{self.slot_wait.summary()}\n"
+            f"inline: {self.inline_latency.summary()}\n"
+            f"offloaded: {self.offload_latency.summary()}"
+        )
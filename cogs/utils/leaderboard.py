@@ -1,6 +1,97 @@
 import asyncio
+import re
+from collections import OrderedDict, namedtuple
+
 import discord
 
+# Pages kept per leaderboard message, so flipping back and forth doesn't refetch
+PAGE_CACHE_SIZE = 8
+
+
+class ListPageSource:
+    """Pages of records that are already in memory."""
+
+    def __init__(self, records):
+        self.records = records
+
+    async def count(self):
+        return len(self.records)
+
+    async def fetch(self, start, end):
+        return self.records[start:end]
+
+
+class RankingPageSource:
+    """Pages of a GuildRanking from the in-memory leaderboard index."""
+
+    def __init__(self, ranking):
+        self.ranking = ranking
+
+    async def count(self):
+        return len(self.ranking)
+
+    async def fetch(self, start, end):
+        return self.ranking.records(start, end)
+
+
+RankingStatements = namedtuple("RankingStatements", "count page find")
+
+
+def ranking_statements(registry, name, sql):
+    """
+    Register the statements QueryPageSource runs for the ranking query `sql`, which
+    selects user_id, count and rank. The find row also has the user's 1-based
+    position in page order, which differs from rank when there are ties.
+    """
+    n = max(int(i) for i in re.findall(r"\$(\d+)", sql))
+    return RankingStatements(
+        count=registry.add(f"{name}_count", f"SELECT COUNT(*) FROM ({sql}) AS ranked"),
+        page=registry.add(
+            f"{name}_page",
+            f"""
+            SELECT * FROM ({sql}) AS ranked
+            ORDER BY rank, user_id
+            LIMIT ${n + 1} OFFSET ${n + 2}
+            """,
+        ),
+        find=registry.add(
+            f"{name}_find",
+            f"""
+            SELECT * FROM (
+                SELECT *, ROW_NUMBER() OVER (ORDER BY rank, user_id) AS position
+                FROM ({sql}) AS ranked
+            ) AS positioned
+            WHERE user_id = ${n + 1}
+            """,
+        ),
+    )
+
+
+class QueryPageSource:
+    """
+    Pages of a ranking query, fetched with LIMIT / OFFSET when they are shown.
+
+    `statements` come from ranking_statements(), and `db` is anything with
+    fetch / fetchval taking a Statement, e.g. the Stats cog so that pages go
+    through its query cache.
+    """
+
+    def __init__(self, db, statements, *args):
+        self.db = db
+        self.statements = statements
+        self.args = args
+
+    async def count(self):
+        return await self.db.fetchval(self.statements.count, *self.args)
+
+    async def fetch(self, start, end):
+        return await self.db.fetch(self.statements.page, *self.args, end - start, start)
+
+    async def find(self, user_id):
+        """The ranked row of `user_id`, or None."""
+        records = await self.db.fetch(self.statements.find, *self.args, user_id)
+        return records[0] if records else None
+
 
 class PaginatedLeaderboard:
     def __init__(
@@ -8,6 +99,7 @@ class PaginatedLeaderboard:
         ctx,
         *,
         records=[],
+        source=None,
         title="Leaderboard",
         description="For the last 30 days (UTC)",
         rank_for="user_id",
@@ -23,7 +115,8 @@ class PaginatedLeaderboard:
 
         self.ctx = ctx
         self.bot = ctx.bot
-        self.records = records
+        self.source = source or ListPageSource(records)
+        self._pages = OrderedDict()
         self.rank_for = rank_for
         self.use_relative_rank = use_relative_rank
         self.find_record = find_record
@@ -35,21 +128,20 @@ class PaginatedLeaderboard:
         self.message = ctx.message
         self.author = ctx.author
         self.per_page = per_page
-        total, left_over = divmod(len(self.records), per_page)
-        if left_over:
-            total += 1
-
-        self.total_pages = total
+        # Set in build() once the source is counted
+        self.total_pages = 0
+        self.paginating = False
         self.current_page = 0
         if find_record:
-            self.find_record_page = self.record_to_rank(find_record) // per_page
+            # Pages are sliced by position, tied ranks can span several of them
+            position = find_record.get("position") or self.record_to_rank(find_record)
+            self.find_record_page = (position - 1) // per_page
         else:
             self.find_record_page = None
 
         self.title = title
         self.description = description
 
-        self.paginating = len(records) > per_page
         self.reaction_emojis = [
             (
                 "\N{BLACK LEFT-POINTING DOUBLE TRIANGLE WITH VERTICAL BAR}",
@@ -78,12 +170,12 @@ class PaginatedLeaderboard:
             return
         self.current_page = page
         start = page * self.per_page
-        end = start + self.per_page
+        records = await self.get_page(page)
         embed = discord.Embed(colour=0x3A8EDB)
         embed.title = self.title
         embed.description = self.description
 
-        for [index, record] in enumerate(self.records[start:end], start=start):
+        for [index, record] in enumerate(records, start=start):
             record_value = self.record_to_value(record)
             rank = index + 1 if self.use_relative_rank else self.record_to_rank(record)
             name = self.name_resolver(rank, record_value, record)
@@ -97,6 +189,18 @@ class PaginatedLeaderboard:
         else:
             self.message = await self.ctx.send(embed=embed)
 
+    async def get_page(self, page):
+        records = self._pages.get(page)
+        if records is None:
+            start = page * self.per_page
+            records = await self.source.fetch(start, start + self.per_page)
+            self._pages[page] = records
+            if len(self._pages) > PAGE_CACHE_SIZE:
+                self._pages.popitem(last=False)
+        else:
+            self._pages.move_to_end(page)
+        return records
+
     async def first_page(self):
         await self.show_page(0)
 
@@ -127,6 +231,9 @@ class PaginatedLeaderboard:
         return False
 
     async def build(self):
+        count = await self.source.count()
+        self.total_pages = -(-count // self.per_page)
+        self.paginating = count > self.per_page
         await self.first_page()
         if self.paginating:
             await self.message.add_reaction(self.reaction_emojis[0][0])
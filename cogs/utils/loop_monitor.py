@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import math
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from .metrics import Histogram, LatencyTracker
+
+log = logging.getLogger(__name__)
+
+# Bounds of the lag histogram, in seconds
+LAG_BOUNDS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+# How often the gateway heartbeat latency is sampled, in seconds
+HEARTBEAT_SAMPLE_INTERVAL = 5.0
+# Frames kept per incident
+STACK_DEPTH = 12
+
+
+class Incident:
+    __slots__ = ("when", "lag", "task", "stack")
+
+    def __init__(self, when, lag, task, stack):
+        self.when = when
+        self.lag = lag
+        self.task = task
+        self.stack = stack
+
+
+class LoopMonitor:
+    """
+    Measures how late the event loop runs a task that sleeps `interval` seconds
+    (scheduling lag), and samples the gateway heartbeat latency from `latency()`.
+
+    A blocked loop can't report on itself, so a watchdog thread checks that the
+    task keeps ticking. Once the loop has been stuck for `threshold` seconds, the
+    thread records what the loop thread is running, along with the current asyncio
+    task, as an incident. The lag is filled in when the loop comes back.
+    """
+
+    def __init__(self, latency, *, interval=0.1, threshold=0.25, incidents=20):
+        self.latency = latency
+        self.interval = interval
+        self.threshold = threshold
+        self.lag = LatencyTracker()
+        self.lag_histogram = Histogram(LAG_BOUNDS)
+        self.heartbeat = LatencyTracker(size=720)
+        self.incidents = deque(maxlen=incidents)
+        self.stalls = 0
+        self.resumes = 0
+        self._last_tick = time.monotonic()
+        self._incident = None
+        self._task = None
+        self._loop = None
+        self._thread_id = None
+        self._stopped = threading.Event()
+        # Guards _last_tick, _incident and incidents against the watchdog thread
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._task = asyncio.create_task(self._tick())
+        self._stopped.clear()
+        threading.Thread(target=self._watch, name="loop_monitor", daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    def reset(self):
+        self.lag.reset()
+        self.lag_histogram.reset()
+        self.heartbeat.reset()
+        with self._lock:
+            self.incidents.clear()
+        self.stalls = 0
+        self.resumes = 0
+
+    async def _tick(self):
+        loop = self._loop
+        next_heartbeat = 0.0
+        with self._lock:
+            self._last_tick = time.monotonic()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            # Together, so an incident is either taken here or not captured at all
+            with self._lock:
+                incident = self._incident
+                self._incident = None
+                self._last_tick = time.monotonic()
+            self.lag.add(lag)
+            self.lag_histogram.add(lag)
+            if lag >= self.threshold:
+                self.stalls += 1
+                if incident is not None:
+                    incident.lag = lag
+                log.warning(
+                    f"Event loop blocked for {lag:.2f}s"
+                    + (f" in {incident.task}" if incident is not None else "")
+                )
+            if start >= next_heartbeat:
+                next_heartbeat = start + HEARTBEAT_SAMPLE_INTERVAL
+                latency = self.latency()
+                if math.isfinite(latency):
+                    self.heartbeat.add(latency)
+
+    def _watch(self):
+        while not self._stopped.wait(self.threshold / 2):
+            last_tick = self._last_tick
+            stuck = time.monotonic() - last_tick - self.interval
+            if stuck < self.threshold or self._incident is not None:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            stack = traceback.format_stack(frame, limit=STACK_DEPTH)
+            task = asyncio.current_task(self._loop)
+            with self._lock:
+                if last_tick != self._last_tick:
+                    # The loop came back while the stack was taken
+                    continue
+                self._incident = Incident(
+                    time.time(),
+                    stuck,
+                    task.get_name() if task is not None else "no task",
+                    "".join(stack),
+                )
+                self.incidents.append(self._incident)
+
+    def summary(self):
+        heartbeat = self.heartbeat.summary() if self.heartbeat.count else "no samples"
+        return (
+            f"loop lag (every {self.interval:g}s): {self.lag.summary()}\n"
+            f"  {self.lag_histogram.summary()}\n"
+            f"stalls >= {self.threshold:g}s: {self.stalls}, "
+            f"{len(self.incidents)} incidents kept\n"
+            f"heartbeat latency: {heartbeat}\n"
+            f"gateway resumes: {self.resumes}"
+        )
+
+    def incident_summary(self, limit=3):
+        with self._lock:
+            incidents = list(self.incidents)[-limit:]
+        lines = []
+        for incident in incidents:
+            when = time.strftime("%H:%M:%S", time.localtime(incident.when))
+            lines.append(
+                f"[{when}] {incident.lag:.2f}s in {incident.task}\n{incident.stack}"
+            )
+        return "\n".join(lines) or "No incidents"
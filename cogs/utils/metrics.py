@@ -0,0 +1,77 @@
+import time
+from bisect import bisect_right
+from collections import deque
+from contextlib import contextmanager
+
+
+class LatencyTracker:
+    """
+    Running totals plus a ring buffer of the most recent samples (in seconds)
+    for percentiles.
+    """
+
+    def __init__(self, size=1000):
+        self.samples = deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(time.perf_counter() - start)
+
+    def percentile(self, p):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * p / 100))
+        return ordered[index]
+
+    def reset(self):
+        self.samples.clear()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def summary(self):
+        if not self.count:
+            return "n=0"
+        avg = self.total / self.count
+        return (
+            f"n={self.count} avg={avg * 1000:.2f}ms "
+            f"p50={self.percentile(50) * 1000:.2f}ms "
+            f"p99={self.percentile(99) * 1000:.2f}ms "
+            f"max={self.max * 1000:.2f}ms"
+        )
+
+
+class Histogram:
+    """Counts of samples (in seconds) falling under each bound, plus overflow."""
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+
+    def add(self, seconds):
+        self.counts[bisect_right(self.bounds, seconds)] += 1
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+
+    def summary(self):
+        labels = [f"<{bound * 1000:g}ms" for bound in self.bounds]
+        labels.append(f">={self.bounds[-1] * 1000:g}ms")
+        return ", ".join(
+            f"{label}: {count}" for label, count in zip(labels, self.counts)
+        )
@@ -178,37 +178,76 @@ async def guess_lang(message):
         return
 
 
+# Single codepoint emojis, which is what a grapheme cluster needs to contain to count
+EMOJI_CHARS = frozenset(e for e in emoji.UNICODE_EMOJI_ENGLISH if len(e) == 1)
+REGEX_EMOJI_CHAR = regex.compile(
+    "[" + "".join(regex.escape(c) for c in sorted(EMOJI_CHARS)) + "]"
+)
+REGEX_GRAPHEME = regex.compile(r"\X")
+
+
 def extract_unicode_emojis(text):
     # https://stackoverflow.com/a/49242754
-    emoji_list = []
-    data = regex.findall(r"\X", text)
-    for word in data:
-        if any(char in emoji.UNICODE_EMOJI_ENGLISH for char in word):
-            emoji_list.append(word)
-    return emoji_list
+    # No emoji is ASCII, so most messages never need to be split into graphemes
+    if text.isascii() or not REGEX_EMOJI_CHAR.search(text):
+        return []
+    return [
+        word
+        for word in REGEX_GRAPHEME.findall(text)
+        if not EMOJI_CHARS.isdisjoint(word)
+    ]
 
 
 JP_RATIO = 1.7
 
 
+def build_lang_table():
+    """
+    Character classes for parse_language, resolved in a single str.translate pass.
+    Mirrors REGEX_ENG / REGEX_JPN: English letters become "e", Japanese become "j",
+    escape asterisks become "*", and whitespace or w/W (laughter) is dropped.
+    Anything left over is counted as another language.
+    """
+    table = {}
+    for c in "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ":
+        table[ord(c)] = "e"
+        table[ord(c) + 0xFEE0] = "e"  # fullwidth
+    for start, end in ((0x3040, 0x30FF), (0xFF66, 0xFF9D), (0x4E00, 0x9FAF)):
+        for cp in range(start, end + 1):
+            table[cp] = "j"
+    for cp in range(0x3001):  # U+3000 is the last whitespace codepoint
+        if chr(cp).isspace():
+            table[cp] = None
+    for c in "wWｗＷ":
+        table[ord(c)] = None
+    table[ord("*")] = table[ord("＊")] = "*"
+    return table
+
+
+LANG_TABLE = build_lang_table()
+
+
 def parse_language(message):
-    jp_count = en_count = ol_count = 0
-    escaped = False
-    lang = ""
-    content = REGEX_DISCORD_OBJ.sub("", message.content)
-    content = REGEX_URL.sub("", content)
+    return parse_content(message.content)
+
+
+# Takes and returns only plain data so that it can also run in a process pool
+def parse_content(content):
+    if "<" in content:
+        content = REGEX_DISCORD_OBJ.sub("", content)
+    if "http" in content:
+        content = REGEX_URL.sub("", content)
     emojis = extract_unicode_emojis(content)
     for emoji in emojis:
         content = content.replace(emoji, "")
-    for c in content:
-        if c == "*" or c == "＊":
-            escaped = True
-        elif REGEX_ENG.match(c):
-            en_count += 1
-        elif REGEX_JPN.match(c):
-            jp_count += 1
-        elif not re.match(r"[\swWｗＷ]", c):
-            ol_count += 1
+
+    classified = content.translate(LANG_TABLE)
+    escape_count = classified.count("*")
+    en_count = classified.count("e")
+    jp_count = classified.count("j")
+    ol_count = len(classified) - escape_count - en_count - jp_count
+    escaped = escape_count > 0
+
     if jp_count == 0 and en_count == 0:
         lang = "OL"  # unknown
     elif jp_count < 3 and en_count < 3 and ol_count > 0:
@@ -0,0 +1,97 @@
+import asyncio
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+
+from .metrics import LatencyTracker
+
+# Frames kept per slow call sample
+STACK_DEPTH = 8
+
+
+def coroutine_frames(coro):
+    """
+    Frames of a suspended coroutine and everything it awaits, outermost first.
+    Task.get_stack() stops at the task's own coroutine.
+    """
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return frames
+
+
+class Profiler:
+    """
+    Wall time of every event listener and command, by name.
+
+    Cirilla measures each listener call and command invocation with measure()
+    while `enabled` is set, and skips it otherwise. When a call is still running
+    `slow_threshold` seconds after it started, the stack of its task is sampled
+    into a ring buffer, which shows what the slow call was waiting on.
+    """
+
+    def __init__(self, *, enabled=False, slow_threshold=0.5, samples=20):
+        self.enabled = enabled
+        self.slow_threshold = slow_threshold
+        self.latency = {}
+        self.slow_samples = deque(maxlen=samples)
+        self.started = time.monotonic()
+
+    @contextmanager
+    def measure(self, name):
+        latency = self.latency.get(name)
+        if latency is None:
+            latency = self.latency[name] = LatencyTracker()
+        loop = asyncio.get_running_loop()
+        sample = loop.call_later(
+            self.slow_threshold, self._sample, name, asyncio.current_task()
+        )
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            latency.add(time.perf_counter() - start)
+            sample.cancel()
+
+    def _sample(self, name, task):
+        if task is None or task.done():
+            return
+        # The innermost frames show what it is waiting on
+        frames = coroutine_frames(task.get_coro())[-STACK_DEPTH:]
+        stack = traceback.StackSummary.extract((f, f.f_lineno) for f in frames)
+        self.slow_samples.append((time.time(), name, "".join(stack.format())))
+
+    def reset(self):
+        self.latency.clear()
+        self.slow_samples.clear()
+        self.started = time.monotonic()
+
+    def summary(self, limit=10):
+        elapsed = time.monotonic() - self.started
+        ranked = sorted(
+            self.latency.items(), key=lambda item: item[1].total, reverse=True
+        )
+        lines = [
+            f"profiling {'on' if self.enabled else 'off'}, {len(self.latency)} "
+            f"handlers over {elapsed:.0f}s, slow calls >= {self.slow_threshold:g}s: "
+            f"{len(self.slow_samples)} sampled"
+        ]
+        for name, latency in ranked[:limit]:
+            lines.append(
+                f"{name}: total {latency.total:.2f}s "
+                f"({latency.total / elapsed * 100 if elapsed else 0:.1f}%), "
+                f"{latency.summary()}"
+            )
+        return "\n".join(lines)
+
+    def slow_summary(self, limit=3):
+        lines = []
+        for timestamp, name, stack in list(self.slow_samples)[-limit:]:
+            when = time.strftime("%H:%M:%S", time.localtime(timestamp))
+            lines.append(f"[{when}] {name}\n{stack}")
+        return "\n".join(lines) or "No slow calls sampled"
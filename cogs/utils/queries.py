@@ -0,0 +1,114 @@
+import logging
+
+import asyncpg
+
+from .metrics import LatencyTracker
+
+log = logging.getLogger(__name__)
+
+
+class Statement:
+    __slots__ = ("name", "sql")
+
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql
+
+    def __repr__(self):
+        return f"<Statement {self.name}>"
+
+
+class StatementConnection(asyncpg.Connection):
+    """
+    asyncpg connection that keeps the registry's statements prepared.
+
+    PreparedStatement objects stop working once their connection goes back to the
+    pool, so the statements are prepared into the connection's own statement
+    cache instead. Running the same SQL text later with fetch() / fetchval() /
+    execute() then skips the parse and plan round trip.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # name -> SQL currently in the statement cache
+        self.statements = {}
+        # name -> SQL that failed to prepare, so it isn't retried on every acquire
+        self.failed_statements = {}
+
+    async def prepare_statements(self, statements):
+        for name, statement in statements.items():
+            if self.statements.get(name) == statement.sql:
+                continue
+            if self.failed_statements.get(name) == statement.sql:
+                continue
+            try:
+                # Same path as fetch(), so the statement lands in the cache it reads
+                await self._get_statement(statement.sql, None)
+            except asyncpg.PostgresError as e:
+                # It still runs unprepared and fails there with the same error
+                self.failed_statements[name] = statement.sql
+                log.warning(f"Couldn't prepare statement {name}: {e}")
+            else:
+                self.statements[name] = statement.sql
+
+
+class QueryRegistry:
+    """
+    Named SQL statements, prepared once on every pool connection.
+
+    Modules register their statements at import with add(), and run them by
+    Statement through fetch / fetchval / execute, which also time each statement.
+    Pools created with `connection_class=StatementConnection` and
+    `setup=registry.setup` prepare whatever is registered (or changed after a
+    cog reload) when a connection is acquired. The pool's statement_cache_size has
+    to leave room for all of them. On other connections asyncpg prepares each
+    statement on first use, so the same code also works with a plain connection.
+    """
+
+    def __init__(self):
+        self.statements = {}
+        self.latency = {}
+
+    def add(self, name, sql):
+        statement = self.statements.get(name)
+        if statement is None:
+            statement = self.statements[name] = Statement(name, sql)
+            self.latency[name] = LatencyTracker(size=200)
+        # A reloaded module may have changed the SQL, setup() prepares it again
+        statement.sql = sql
+        return statement
+
+    async def setup(self, conn):
+        # Pools pass a PoolConnectionProxy, which forwards attributes to the
+        # connection but isn't a StatementConnection itself
+        prepare_statements = getattr(conn, "prepare_statements", None)
+        if prepare_statements is not None:
+            await prepare_statements(self.statements)
+
+    async def fetch(self, conn, statement, *args):
+        return await self._run(conn, statement, "fetch", args)
+
+    async def fetchval(self, conn, statement, *args):
+        return await self._run(conn, statement, "fetchval", args)
+
+    async def execute(self, conn, statement, *args):
+        await self._run(conn, statement, "execute", args)
+
+    async def _run(self, conn, statement, method, args):
+        if isinstance(conn, asyncpg.Pool):
+            async with conn.acquire() as connection:
+                return await self._run(connection, statement, method, args)
+        with self.latency[statement.name].time():
+            return await getattr(conn, method)(statement.sql, *args)
+
+    def summary(self, limit=15):
+        used = [
+            (name, latency) for name, latency in self.latency.items() if latency.count
+        ]
+        used.sort(key=lambda item: item[1].total, reverse=True)
+        lines = [f"{len(self.statements)} statements, {len(used)} used"]
+        lines += [f"{name}: {latency.summary()}" for name, latency in used[:limit]]
+        return "\n".join(lines)
+
+
+registry = QueryRegistry()
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, defaultdict
+
+log = logging.getLogger(__name__)
+
+
+class CacheEntry:
+    __slots__ = ("guild_id", "value", "rows", "expires", "stale", "refresh")
+
+    def __init__(self, guild_id, value, rows, expires, stale):
+        self.guild_id = guild_id
+        self.value = value
+        self.rows = rows
+        self.expires = expires
+        self.stale = stale
+        self.refresh = None
+
+
+class QueryCache:
+    """
+    LRU cache of query results for the Stats commands, grouped by guild.
+
+    Entries expire after `ttl` seconds. When new rows for a guild are written, its
+    entries are marked stale instead of being dropped: a stale entry is still
+    served, but the first hit reloads it in the background (stale-while-revalidate).
+    At most `max_rows` result rows are kept in total.
+    """
+
+    def __init__(self, *, ttl=60.0, max_rows=100_000):
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.rows = 0
+        self._entries = OrderedDict()
+        self._by_guild = defaultdict(set)
+        # Bumped on every invalidation, so results loaded across one are stored stale
+        self._generations = defaultdict(int)
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+
+    async def get(self, guild_id, key, load):
+        """Return the cached result for `key`, calling `load()` on a miss."""
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires > time.monotonic():
+            self._entries.move_to_end(key)
+            if entry.stale:
+                self.stale_hits += 1
+                if entry.refresh is None:
+                    entry.refresh = asyncio.create_task(
+                        self._refresh(guild_id, key, load)
+                    )
+            else:
+                self.hits += 1
+            return entry.value
+
+        self.misses += 1
+        generation = self._generations[guild_id]
+        value = await load()
+        self._store(guild_id, key, value, generation)
+        return value
+
+    async def _refresh(self, guild_id, key, load):
+        generation = self._generations[guild_id]
+        try:
+            value = await load()
+        except Exception:
+            log.exception("Refreshing a cached stats query failed")
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.refresh = None
+            return
+        self.refreshes += 1
+        self._store(guild_id, key, value, generation)
+
+    def _store(self, guild_id, key, value, generation):
+        self._discard(key)
+        rows = len(value) if isinstance(value, list) else 1
+        if rows > self.max_rows:
+            return
+        self._entries[key] = CacheEntry(
+            guild_id,
+            value,
+            rows,
+            time.monotonic() + self.ttl,
+            stale=generation != self._generations[guild_id],
+        )
+        self._by_guild[guild_id].add(key)
+        self.rows += rows
+        while self.rows > self.max_rows:
+            self._discard(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.rows -= entry.rows
+        keys = self._by_guild[entry.guild_id]
+        keys.discard(key)
+        if not keys:
+            del self._by_guild[entry.guild_id]
+
+    def generation(self, guild_id):
+        return self._generations[guild_id]
+
+    def invalidate(self, guild_ids):
+        """Mark everything cached for `guild_ids` stale after new rows were written."""
+        for guild_id in guild_ids:
+            self._generations[guild_id] += 1
+            for key in self._by_guild.get(guild_id, ()):
+                self._entries[key].stale = True
+
+    def invalidate_all(self):
+        self.invalidate(list(self._generations))
+
+    def clear(self):
+        self._entries.clear()
+        self._by_guild.clear()
+        self.rows = 0
+
+    def summary(self):
+        lookups = self.hits + self.stale_hits + self.misses
+        hit_rate = (self.hits + self.stale_hits) / lookups * 100 if lookups else 0
+        return (
+            f"entries: {len(self._entries)} ({self.rows}/{self.max_rows} rows, ttl {self.ttl:.0f}s)\n"
+            f"hits: {self.hits}, stale hits: {self.stale_hits}, misses: {self.misses} ({hit_rate:.1f}% hit rate)\n"
+            f"background refreshes: {self.refreshes}\n"
+            f"evictions: {self.evictions}"
+        )
@@ -0,0 +1,112 @@
+from bisect import bisect_left, insort
+
+
+class GuildRanking:
+    """
+    30-day message totals of one guild, kept sorted by count.
+
+    `keys` holds (-count, user_id) in ascending order, so the highest count comes
+    first and a user's RANK() is one bisect away.
+    """
+
+    __slots__ = ("counts", "keys")
+
+    def __init__(self, counts=None):
+        self.counts = dict(counts or {})
+        self.keys = sorted((-count, user_id) for user_id, count in self.counts.items())
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, user_id, delta):
+        old = self.counts.get(user_id)
+        if old is not None:
+            del self.keys[bisect_left(self.keys, (-old, user_id))]
+        count = (old or 0) + delta
+        if count > 0:
+            self.counts[user_id] = count
+            insort(self.keys, (-count, user_id))
+        else:
+            self.counts.pop(user_id, None)
+
+    def update(self, deltas):
+        # Re-sorting is cheaper than many list inserts once a good part of the guild changed
+        if len(deltas) * 8 < len(self.keys):
+            for user_id, delta in deltas.items():
+                self.add(user_id, delta)
+            return
+        for user_id, delta in deltas.items():
+            count = self.counts.get(user_id, 0) + delta
+            if count > 0:
+                self.counts[user_id] = count
+            else:
+                self.counts.pop(user_id, None)
+        self.keys = sorted((-count, user_id) for user_id, count in self.counts.items())
+
+    def rank(self, user_id):
+        count = self.counts.get(user_id)
+        if count is None:
+            return None
+        return bisect_left(self.keys, (-count,)) + 1
+
+    def record(self, user_id):
+        """The user's row in the same shape as the ranked leaderboard find query."""
+        count = self.counts.get(user_id)
+        if count is None:
+            return None
+        return {
+            "user_id": user_id,
+            "count": count,
+            "rank": bisect_left(self.keys, (-count,)) + 1,
+            "position": bisect_left(self.keys, (-count, user_id)) + 1,
+        }
+
+    def records(self, start=0, end=None):
+        rows = []
+        rank = None
+        previous = None
+        for index, (negative_count, user_id) in enumerate(
+            self.keys[start:end], start=start
+        ):
+            if negative_count != previous:
+                rank = bisect_left(self.keys, (negative_count,)) + 1
+                previous = negative_count
+            rows.append({"user_id": user_id, "count": -negative_count, "rank": rank})
+        return rows
+
+
+class LeaderboardIndex:
+    """
+    In-memory copy of user_totals for ,lb.
+
+    It is seeded from Postgres, then every flushed batch is applied to it. Expiring
+    days are only visible in Postgres, so Stats reloads it from there periodically.
+    """
+
+    def __init__(self):
+        self.guilds = {}
+        self.seeded = False
+
+    def load(self, records):
+        counts = {}
+        for r in records:
+            counts.setdefault(r["guild_id"], {})[r["user_id"]] = r["total"]
+        self.guilds = {
+            guild_id: GuildRanking(users) for guild_id, users in counts.items()
+        }
+        self.seeded = True
+
+    def apply(self, messages):
+        """Add flushed message rows (in MESSAGE_COLUMNS order)."""
+        deltas = {}
+        for guild_id, _, user_id, _, _, count in messages:
+            users = deltas.setdefault(guild_id, {})
+            users[user_id] = users.get(user_id, 0) + count
+        for guild_id, users in deltas.items():
+            ranking = self.guilds.get(guild_id)
+            if ranking is None:
+                ranking = self.guilds[guild_id] = GuildRanking()
+            ranking.update(users)
+
+    def get(self, guild_id):
+        return self.guilds.get(guild_id)
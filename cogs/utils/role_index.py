@@ -0,0 +1,58 @@
+from collections import defaultdict
+
+
+class RoleIndex:
+    """
+    role_id -> set of member ids, for filtering leaderboards by role in SQL.
+
+    A guild's index is built from its member cache the first time it is needed and
+    then kept up to date from member events, which Stats forwards. After a
+    reconnect events may have been missed, so everything is rebuilt lazily again.
+    """
+
+    def __init__(self):
+        self.guilds = {}
+
+    def members(self, role):
+        roles = self.guilds.get(role.guild.id)
+        if roles is None:
+            roles = self.guilds[role.guild.id] = self._build(role.guild)
+        return roles.get(role.id, set())
+
+    def _build(self, guild):
+        roles = defaultdict(set)
+        for member in guild.members:
+            for role in member.roles:
+                roles[role.id].add(member.id)
+        return roles
+
+    def add_member(self, member):
+        roles = self.guilds.get(member.guild.id)
+        if roles is not None:
+            for role in member.roles:
+                roles[role.id].add(member.id)
+
+    def remove_member(self, member):
+        roles = self.guilds.get(member.guild.id)
+        if roles is not None:
+            for role in member.roles:
+                roles[role.id].discard(member.id)
+
+    def update_member(self, before, after):
+        roles = self.guilds.get(after.guild.id)
+        if roles is None or before.roles == after.roles:
+            return
+        before_ids = {r.id for r in before.roles}
+        after_ids = {r.id for r in after.roles}
+        for role_id in before_ids - after_ids:
+            roles[role_id].discard(after.id)
+        for role_id in after_ids - before_ids:
+            roles[role_id].add(after.id)
+
+    def remove_role(self, role):
+        roles = self.guilds.get(role.guild.id)
+        if roles is not None:
+            roles.pop(role.id, None)
+
+    def clear(self):
+        self.guilds.clear()
@@ -0,0 +1,41 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls.
+
+    While a call for `key` is in flight, other callers with the same key await its
+    result instead of starting their own, so N people running ,lb at once cost one
+    query and one pool connection. A caller being cancelled doesn't cancel the call
+    for the others.
+    """
+
+    def __init__(self):
+        self._in_flight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key, call):
+        future = self._in_flight.get(key)
+        if future is None:
+            self.calls += 1
+            future = asyncio.ensure_future(call())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda f: self._done(key, f))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(future)
+
+    def _done(self, key, future):
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
+        # Mark the exception as retrieved in case every caller was cancelled
+        if not future.cancelled():
+            future.exception()
+
+    def summary(self):
+        return (
+            f"queries in flight: {len(self._in_flight)}\n"
+            f"queries run: {self.calls}, coalesced: {self.coalesced}"
+        )
@@ -5,15 +5,44 @@ CREATE TABLE IF NOT EXISTS guilds(
   guild_id BIGINT UNIQUE PRIMARY KEY
 );
 
+-- messages, emojis and voice are range partitioned by utc_date with one partition
+-- per day (messages_20240131 etc), so retention drops whole days instead of
+-- deleting rows. Stats.clear_old_records creates upcoming partitions and drops
+-- expired ones. Rows for days without a partition land in the _default partitions.
+
+-- Migration from the unpartitioned tables: move them out of the way here,
+-- their rows are copied into the partitions further down.
+DO $$
+DECLARE
+  parent TEXT;
+BEGIN
+  FOREACH parent IN ARRAY ARRAY['messages', 'emojis', 'voice'] LOOP
+    -- Only this schema's table, a plain one elsewhere on the search_path isn't ours
+    IF (
+      SELECT relkind FROM pg_class
+      WHERE oid = to_regclass(format('%I.%I', current_schema(), parent))
+    ) = 'r' THEN
+      EXECUTE format('ALTER TABLE %I.%I RENAME TO %I',
+        current_schema(), parent, parent || '_unpartitioned');
+      EXECUTE format('ALTER TABLE %I.%I RENAME CONSTRAINT %I TO %I', current_schema(),
+        parent || '_unpartitioned', parent || '_pk', parent || '_unpartitioned_pk');
+    END IF;
+  END LOOP;
+  DROP INDEX IF EXISTS message_guild_user_id_idx, emoji_guild_user_id_idx,
+    voice_guild_user_id_idx, message_channel_idx, message_date_idx, emoji_date_idx,
+    voice_date_idx;
+END $$;
+
 CREATE TABLE IF NOT EXISTS messages(
   guild_id BIGINT NOT NULL REFERENCES guilds(guild_id),
   channel_id BIGINT NOT NULL,
   user_id BIGINT NOT NULL,
   lang LANGTYPE NOT NULL, -- 0 = ol, 1 = jp, 2 = en
   utc_date DATE NOT NULL,
-  message_count INT NOT NULL
-);
-ALTER TABLE messages ADD CONSTRAINT messages_pk PRIMARY KEY (guild_id, channel_id, user_id, lang, utc_date);
+  message_count INT NOT NULL,
+  CONSTRAINT messages_pk PRIMARY KEY (guild_id, channel_id, user_id, lang, utc_date)
+) PARTITION BY RANGE (utc_date);
+CREATE TABLE IF NOT EXISTS messages_default PARTITION OF messages DEFAULT;
 
 
 CREATE TABLE IF NOT EXISTS emojis(
@@ -21,17 +50,88 @@ CREATE TABLE IF NOT EXISTS emojis(
   user_id BIGINT NOT NULL,
   emoji TEXT NOT NULL,
   utc_date DATE NOT NULL,
-  emoji_count INT NOT NULL
-);
-ALTER TABLE emojis ADD CONSTRAINT emojis_pk PRIMARY KEY (guild_id, user_id, emoji, utc_date);
+  emoji_count INT NOT NULL,
+  CONSTRAINT emojis_pk PRIMARY KEY (guild_id, user_id, emoji, utc_date)
+) PARTITION BY RANGE (utc_date);
+CREATE TABLE IF NOT EXISTS emojis_default PARTITION OF emojis DEFAULT;
 
 CREATE TABLE IF NOT EXISTS voice(
   guild_id BIGINT NOT NULL REFERENCES guilds(guild_id),
   user_id BIGINT NOT NULL,
   utc_date DATE NOT NULL,
-  minute_count INT NOT NULL
-);
-ALTER TABLE voice ADD CONSTRAINT voice_pk PRIMARY KEY (guild_id, user_id, utc_date);
+  minute_count INT NOT NULL,
+  CONSTRAINT voice_pk PRIMARY KEY (guild_id, user_id, utc_date)
+) PARTITION BY RANGE (utc_date);
+CREATE TABLE IF NOT EXISTS voice_default PARTITION OF voice DEFAULT;
+
+-- Creates the daily partitions of messages, emojis and voice for [first_day, last_day].
+-- Rows already in a _default partition for a new day are moved into it. Each
+-- partition is created on its own, one that fails doesn't hold back the others, and
+-- the error of each failed one is returned.
+DROP FUNCTION IF EXISTS create_stats_partitions(DATE, DATE);
+CREATE FUNCTION create_stats_partitions(first_day DATE, last_day DATE)
+RETURNS SETOF TEXT AS $$
+DECLARE
+  day DATE;
+  parent TEXT;
+  partition TEXT;
+BEGIN
+  FOR day IN SELECT generate_series(first_day, last_day, INTERVAL '1 day')::DATE LOOP
+    FOREACH parent IN ARRAY ARRAY['messages', 'emojis', 'voice'] LOOP
+      partition := parent || '_' || to_char(day, 'YYYYMMDD');
+      IF to_regclass(format('%I.%I', current_schema(), partition)) IS NOT NULL THEN
+        CONTINUE;
+      END IF;
+      BEGIN
+        -- Keeps new rows out of the default partition while its rows are moved
+        EXECUTE format('LOCK TABLE %I IN EXCLUSIVE MODE', parent || '_default');
+        EXECUTE format(
+          'CREATE TEMP TABLE stats_partition_moved AS '
+          'SELECT * FROM %I WHERE utc_date = %L', parent || '_default', day
+        );
+        EXECUTE format('DELETE FROM %I WHERE utc_date = %L', parent || '_default', day);
+        EXECUTE format(
+          'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+          partition, parent, day, day + 1
+        );
+        EXECUTE format('INSERT INTO %I SELECT * FROM stats_partition_moved', parent);
+        DROP TABLE stats_partition_moved;
+      EXCEPTION WHEN OTHERS THEN
+        RETURN NEXT format('%s: %s', partition, SQLERRM);
+      END;
+    END LOOP;
+  END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT create_stats_partitions(CURRENT_DATE - 30, CURRENT_DATE + 7);
+
+-- Copy the unpartitioned tables over, creating partitions for any older days first
+DO $$
+DECLARE
+  first_day DATE;
+BEGIN
+  IF to_regclass('messages_unpartitioned') IS NOT NULL THEN
+    SELECT LEAST(
+      (SELECT MIN(utc_date) FROM messages_unpartitioned),
+      (SELECT MIN(utc_date) FROM emojis_unpartitioned),
+      (SELECT MIN(utc_date) FROM voice_unpartitioned)
+    ) INTO first_day;
+    IF first_day IS NOT NULL THEN
+      PERFORM create_stats_partitions(first_day, CURRENT_DATE);
+    END IF;
+    INSERT INTO messages (guild_id, channel_id, user_id, lang, utc_date, message_count)
+    SELECT guild_id, channel_id, user_id, lang, utc_date, message_count
+    FROM messages_unpartitioned;
+    INSERT INTO emojis (guild_id, user_id, emoji, utc_date, emoji_count)
+    SELECT guild_id, user_id, emoji, utc_date, emoji_count
+    FROM emojis_unpartitioned;
+    INSERT INTO voice (guild_id, user_id, utc_date, minute_count)
+    SELECT guild_id, user_id, utc_date, minute_count
+    FROM voice_unpartitioned;
+    DROP TABLE messages_unpartitioned, emojis_unpartitioned, voice_unpartitioned;
+  END IF;
+END $$;
 
 CREATE TABLE IF NOT EXISTS deletes(
     guild_id BIGINT NOT NULL REFERENCES guilds(guild_id),
@@ -42,15 +142,135 @@ CREATE TABLE IF NOT EXISTS deletes(
 ALTER TABLE deletes ADD CONSTRAINT delete_pk PRIMARY KEY (guild_id, user_id, utc_date);
 
 
--- ,u
-CREATE INDEX IF NOT EXISTS message_guild_user_id_idx ON messages(guild_id, user_id);
-CREATE INDEX IF NOT EXISTS emoji_guild_user_id_idx ON emojis(guild_id, user_id);
-CREATE INDEX IF NOT EXISTS voice_guild_user_id_idx ON voice(guild_id, user_id);
+-- Covering indexes, one per query shape in cogs/statistics.py, so the raw tables are
+-- read with index-only scans. Past days' partitions are rarely updated, only by
+-- late or requeued batches, so their visibility maps stay mostly set until autovacuum
+-- catches up. benchmarks/query_plans.py checks the plans.
+-- The rollup tables are served by their primary keys and rank indexes below.
+DROP INDEX IF EXISTS message_guild_user_id_idx, emoji_guild_user_id_idx,
+  voice_guild_user_id_idx, message_channel_idx;
+
+-- ,u: MESSAGES_FOR_USERS and USER_MESSAGES
+CREATE INDEX IF NOT EXISTS messages_guild_user_covering_idx ON messages(guild_id, user_id)
+  INCLUDE (channel_id, lang, utc_date, message_count);
+-- ,u: USER_TOP_EMOJIS
+CREATE INDEX IF NOT EXISTS emojis_guild_user_covering_idx ON emojis(guild_id, user_id)
+  INCLUDE (emoji, emoji_count);
+-- ,u: USER_VOICE_MINUTES
+CREATE INDEX IF NOT EXISTS voice_guild_user_covering_idx ON voice(guild_id, user_id)
+  INCLUDE (minute_count);
+-- ,emlb: grouped by emoji over a whole guild, or for a single emoji
+CREATE INDEX IF NOT EXISTS emojis_guild_emoji_covering_idx ON emojis(guild_id, emoji)
+  INCLUDE (user_id, emoji_count);
+
+-- Staging tables for COPY based ingestion (stats_ingest_mode = 'copy').
+-- Rows only live for the duration of a bulk_insert transaction.
+CREATE UNLOGGED TABLE IF NOT EXISTS messages_staging (LIKE messages);
+CREATE UNLOGGED TABLE IF NOT EXISTS emojis_staging (LIKE emojis);
+CREATE UNLOGGED TABLE IF NOT EXISTS voice_staging (LIKE voice);
+
+-- Rolling totals over everything currently in messages / voice, so leaderboards
+-- don't re-aggregate 30 days of rows. Stats.bulk_insert adds to them and
+-- Stats.clear_old_records subtracts the expired days.
+CREATE TABLE IF NOT EXISTS user_totals(
+  guild_id BIGINT NOT NULL REFERENCES guilds(guild_id),
+  user_id BIGINT NOT NULL,
+  total INT NOT NULL,
+  jp INT NOT NULL,
+  en INT NOT NULL,
+  ol INT NOT NULL,
+  CONSTRAINT user_totals_pk PRIMARY KEY (guild_id, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS channel_user_totals(
+  guild_id BIGINT NOT NULL REFERENCES guilds(guild_id),
+  channel_id BIGINT NOT NULL,
+  user_id BIGINT NOT NULL,
+  total INT NOT NULL,
+  CONSTRAINT channel_user_totals_pk PRIMARY KEY (guild_id, channel_id, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS voice_totals(
+  guild_id BIGINT NOT NULL REFERENCES guilds(guild_id),
+  user_id BIGINT NOT NULL,
+  minute_count INT NOT NULL,
+  CONSTRAINT voice_totals_pk PRIMARY KEY (guild_id, user_id)
+);
+
+-- ,lb / ,vclb ranking, and the ratios of ,jplb / ,enlb. channel_user_totals isn't
+-- given one, total is updated on every flush and keeping it out of indexes leaves
+-- those updates HOT. ,chlb reads it through the primary key.
+DROP INDEX IF EXISTS user_totals_rank_idx, voice_totals_rank_idx;
+CREATE INDEX IF NOT EXISTS user_totals_rank_covering_idx
+  ON user_totals(guild_id, total DESC) INCLUDE (user_id, jp, en);
+CREATE INDEX IF NOT EXISTS voice_totals_rank_covering_idx
+  ON voice_totals(guild_id, minute_count DESC) INCLUDE (user_id);
+
+-- Backfill the totals from existing data the first time they are created
+INSERT INTO user_totals (guild_id, user_id, total, jp, en, ol)
+SELECT guild_id, user_id, SUM(message_count),
+  COALESCE(SUM(message_count) FILTER (WHERE lang = 'JP'), 0),
+  COALESCE(SUM(message_count) FILTER (WHERE lang = 'EN'), 0),
+  COALESCE(SUM(message_count) FILTER (WHERE lang = 'OL'), 0)
+FROM messages
+WHERE NOT EXISTS (SELECT 1 FROM user_totals)
+GROUP BY guild_id, user_id;
+
+INSERT INTO channel_user_totals (guild_id, channel_id, user_id, total)
+SELECT guild_id, channel_id, user_id, SUM(message_count)
+FROM messages
+WHERE NOT EXISTS (SELECT 1 FROM channel_user_totals)
+GROUP BY guild_id, channel_id, user_id;
+
+INSERT INTO voice_totals (guild_id, user_id, minute_count)
+SELECT guild_id, user_id, SUM(minute_count)
+FROM voice
+WHERE NOT EXISTS (SELECT 1 FROM voice_totals)
+GROUP BY guild_id, user_id;
+
+-- Daily message counts behind ,sac / ,cac / ,ac, maintained by Stats.bulk_insert
+-- next to the totals above. Stats.clear_old_records deletes the expired days.
+CREATE TABLE IF NOT EXISTS guild_daily_totals(
+  guild_id BIGINT NOT NULL REFERENCES guilds(guild_id),
+  utc_date DATE NOT NULL,
+  message_count INT NOT NULL,
+  CONSTRAINT guild_daily_totals_pk PRIMARY KEY (guild_id, utc_date)
+);
+
+CREATE TABLE IF NOT EXISTS channel_daily_totals(
+  guild_id BIGINT NOT NULL REFERENCES guilds(guild_id),
+  channel_id BIGINT NOT NULL,
+  utc_date DATE NOT NULL,
+  message_count INT NOT NULL,
+  CONSTRAINT channel_daily_totals_pk PRIMARY KEY (guild_id, channel_id, utc_date)
+);
+
+CREATE TABLE IF NOT EXISTS user_daily_totals(
+  guild_id BIGINT NOT NULL REFERENCES guilds(guild_id),
+  user_id BIGINT NOT NULL,
+  utc_date DATE NOT NULL,
+  message_count INT NOT NULL,
+  CONSTRAINT user_daily_totals_pk PRIMARY KEY (guild_id, user_id, utc_date)
+);
+
+-- Retention
+CREATE INDEX IF NOT EXISTS channel_daily_totals_date_idx ON channel_daily_totals(utc_date);
+CREATE INDEX IF NOT EXISTS user_daily_totals_date_idx ON user_daily_totals(utc_date);
+
+INSERT INTO guild_daily_totals (guild_id, utc_date, message_count)
+SELECT guild_id, utc_date, SUM(message_count)
+FROM messages
+WHERE NOT EXISTS (SELECT 1 FROM guild_daily_totals)
+GROUP BY guild_id, utc_date;
 
--- ,channel-leaderboard
-CREATE INDEX IF NOT EXISTS message_channel_idx ON messages(channel_id);
+INSERT INTO channel_daily_totals (guild_id, channel_id, utc_date, message_count)
+SELECT guild_id, channel_id, utc_date, SUM(message_count)
+FROM messages
+WHERE NOT EXISTS (SELECT 1 FROM channel_daily_totals)
+GROUP BY guild_id, channel_id, utc_date;
 
--- For deleting old ones
-CREATE INDEX IF NOT EXISTS message_date_idx ON messages(utc_date); 
-CREATE INDEX IF NOT EXISTS emoji_date_idx ON emojis(utc_date);
-CREATE INDEX IF NOT EXISTS voice_date_idx ON voice(utc_date);
+INSERT INTO user_daily_totals (guild_id, user_id, utc_date, message_count)
+SELECT guild_id, user_id, utc_date, SUM(message_count)
+FROM messages
+WHERE NOT EXISTS (SELECT 1 FROM user_daily_totals)
+GROUP BY guild_id, user_id, utc_date;
@@ -1,11 +1,12 @@
 import asyncio
-import asyncpg
 import logging
 import contextlib
 import uvloop
 import sys
 
 from bot import Cirilla
+from cogs.utils.db_pool import create_pool
+from cogs.utils.queries import registry
 import config
 
 # Faster asyncio
@@ -43,6 +44,37 @@ def setup_logging():
             log.removeHandler(hdlr)
 
 
+def open_pool(name, db, *, min_size, max_size):
+    # Statements registered in cogs.utils.queries are prepared on every connection,
+    # the statement cache is sized to hold them next to ad-hoc queries
+    return create_pool(
+        **db,
+        name=name,
+        command_timeout=60,
+        min_size=min_size,
+        max_size=max_size,
+        max_queries=getattr(config, "db_pool_max_queries", 50000),
+        max_inactive_connection_lifetime=getattr(config, "db_pool_max_idle", 300.0),
+        statement_cache_size=getattr(config, "db_statement_cache_size", 256),
+        slow_query_threshold=getattr(config, "db_slow_query_threshold", 1.0),
+        setup=registry.setup,
+    )
+
+
+async def open_read_pool():
+    """Stats command pool, on the read replica when one is configured."""
+    size = getattr(config, "db_read_pool_size", 5)
+    replica = getattr(config, "db_replica", None)
+    if replica:
+        try:
+            return await open_pool("read", replica, min_size=size, max_size=size)
+        except Exception:
+            logging.getLogger().exception(
+                "Failed to connect to the read replica, reading from the primary"
+            )
+    return await open_pool("read", config.db, min_size=size, max_size=size)
+
+
 async def run_bot():
     log = logging.getLogger()
 
@@ -51,15 +83,33 @@ async def run_bot():
     #     async with bot:
     #         await bot.start(config.token)
     #         print("Bot finished running")
+    pools = []
     try:
-        pool = await asyncpg.create_pool(**config.db, command_timeout=60)
+        pool = await open_pool(
+            "main",
+            config.db,
+            min_size=getattr(config, "db_pool_min_size", 10),
+            max_size=getattr(config, "db_pool_max_size", 10),
+        )
+        pools.append(pool)
+        # Stats ingestion and retention, so flushes don't queue commands behind them
+        write_size = getattr(config, "db_write_pool_size", 2)
+        write_pool = await open_pool(
+            "write", config.db, min_size=write_size, max_size=write_size
+        )
+        pools.append(write_pool)
+        read_pool = await open_read_pool()
+        pools.append(read_pool)
     except:
         log.exception("Failed to initialize Postgres")
+        for pool in pools:
+            await pool.close()
         return
-    bot = Cirilla(pool)
+    bot = Cirilla(pool, read_pool=read_pool, write_pool=write_pool)
     async with bot:
         await bot.start(config.token)
-    await pool.close()
+    for pool in pools:
+        await pool.close()
 
 
 async def main():